@@ -0,0 +1 @@
+# the command line entry points of the headless extraction, run with python -m
@@ -0,0 +1,47 @@
+"""
+Extract the alerts of every feature of an aoi file without the application.
+
+    python -m component.cli.batch aois.gpkg RADD 2023-01-01 2023-06-30 --mmu 1
+"""
+
+import argparse
+
+from component import parameter as cp
+from component import scripts as cs
+from component.message import cm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=cm.batch.description)
+    parser.add_argument("aois")
+    parser.add_argument("collection", choices=list(cp.alert_drivers))
+    parser.add_argument("start")
+    parser.add_argument("end")
+    parser.add_argument("--mmu", type=float, default=0)
+    parser.add_argument("--asset", default=None)
+    parser.add_argument("--raster", default=None)
+    parser.add_argument("--backend", default="gee", choices=["gee", "local"])
+    parser.add_argument("--name-column", default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default=cp.result_dir)
+    args = parser.parse_args()
+
+    outputs = cs.run_batch(
+        args.aois,
+        args.collection,
+        args.start,
+        args.end,
+        args.mmu,
+        name_column=args.name_column,
+        processes=args.processes,
+        folder=args.output,
+        asset=args.asset,
+        raster=args.raster,
+        backend=args.backend,
+    )
+    for name, output in outputs.items():
+        print(name, output)
+
+
+if __name__ == "__main__":
+    main()
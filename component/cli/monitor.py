@@ -0,0 +1,30 @@
+"""
+Run the monitors of a configuration file on their schedule.
+
+    python -m component.cli.monitor monitors.json [--once]
+"""
+
+import argparse
+import json
+import logging
+from pathlib import Path
+
+import ee
+
+from component import scripts as cs
+from component.message import cm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=cm.monitor.description)
+    parser.add_argument("config")
+    parser.add_argument("--once", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ee.Initialize()
+    cs.serve(json.loads(Path(args.config).read_text()), once=args.once)
+
+
+if __name__ == "__main__":
+    main()
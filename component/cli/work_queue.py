@@ -0,0 +1,69 @@
+"""
+Extract large aois with several worker processes sharing a persistent queue.
+
+    python -m component.cli.work_queue submit aoi.gpkg RADD 2023-01-01 2023-06-30
+    python -m component.cli.work_queue work <job> --name w1  # one name per worker process
+    python -m component.cli.work_queue merge <job> alerts.gpkg
+"""
+
+import argparse
+
+import ee
+
+from component import parameter as cp
+from component import scripts as cs
+from component.message import cm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=cm.queue.description)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit")
+    submit.add_argument("aoi")
+    submit.add_argument("collection", choices=list(cp.alert_drivers))
+    submit.add_argument("start")
+    submit.add_argument("end")
+    submit.add_argument("--mmu", type=float, default=0)
+    submit.add_argument("--asset", default=None)
+    submit.add_argument("--backend", default="gee", choices=["gee", "local"])
+
+    work = commands.add_parser("work")
+    work.add_argument("job")
+    work.add_argument("--threads", type=int, default=cp.max_workers)
+    work.add_argument("--name", default=None)
+
+    merge = commands.add_parser("merge")
+    merge.add_argument("job")
+    merge.add_argument("output")
+
+    # the same queue database is used by all the commands of a job
+    for command in [submit, work, merge]:
+        command.add_argument("--queue", default=cp.queue_file)
+
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        job = cs.submit_aoi(
+            args.aoi,
+            args.collection,
+            args.start,
+            args.end,
+            args.mmu,
+            args.asset,
+            args.backend,
+            args.queue,
+        )
+        print(job, cs.WorkQueue(args.queue).progress(job))
+    elif args.command == "work":
+        ee.Initialize()
+        progress = cs.run_worker(
+            args.job, args.queue, max_workers=args.threads, name=args.name
+        )
+        print(progress)
+    elif args.command == "merge":
+        print(cs.merge_job(args.job, args.output, args.queue))
+
+
+if __name__ == "__main__":
+    main()
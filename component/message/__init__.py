@@ -1,7 +1,23 @@
+import json
 import os
 from pathlib import Path
 
-from sepal_ui.translator import Translator
+# the widgets are not installed for the headless runs (see component.cli)
+try:
+    from sepal_ui.translator import Translator
+except ImportError:
+    Translator = None
+
+
+class _Messages(dict):
+    """the keys of a locale file read as attributes, used without sepal_ui"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
 
 # the sepal_ui allows you to create a translation interface
 # at the moment this variable is not yet available but it's a good practice to build your app translatio-ready
@@ -16,4 +32,9 @@ if "CUSTOM_LANGUAGE" in os.environ:
 # the base language is english and every untranslated messages will be fallback to the english key
 # complete the json file the add keys in the app
 # avoid hard written messages at all cost
-cm = Translator(Path(__file__).parent, lang)
+if Translator is not None:
+    cm = Translator(Path(__file__).parent, lang)
+else:
+    locale = Path(__file__).parent / lang / "locale.json"
+    locale = locale if locale.is_file() else Path(__file__).parent / "en/locale.json"
+    cm = json.loads(locale.read_text(), object_hook=_Messages)
@@ -1,8 +1,11 @@
+import threading
+
 from sepal_ui import model
 from traitlets import Any
 from ipyleaflet import GeoJSON
 
 from component import parameter as cp
+from component import scripts as cs
 from component.message import cm
 
 
@@ -17,6 +20,9 @@ class AlertModel(model.Model):
     asset = Any(None).tag(sync=True)
     "the asset of the NRT alert system only used for NRT alert collections"
 
+    raster = Any(None).tag(sync=True)
+    "a local GeoTIFF output of the NRT or CUSUM systems, used instead of the asset"
+
     alert_type = Any("RECENT").tag(sync=True)
     "if the alert is using recent or historical source"
 
@@ -29,6 +35,12 @@ class AlertModel(model.Model):
     min_size = Any(0).tag(sync=True)
     "the minimal size of an alert in ha"
 
+    backend = Any(cp.vectorization_backend).tag(sync=True)
+    "the vectorization backend of the GEE collections: 'gee' or 'local'"
+
+    incremental = Any(False).tag(sync=True)
+    "if True only the days since the last run of the same aoi are retreived (RECENT only)"
+
     current_id = Any(None).tag(sync=True)
     "the id of the feature currently displayed on the map"
 
@@ -57,9 +69,25 @@ class AlertModel(model.Model):
     gdf = Any(None).tag(sync=True)
     "the alerts as a geopandas dataframe"
 
+    all_gdf = Any(None).tag(sync=True)
+    "the unfiltered alerts of the last extraction, sorted by decreasing surface"
+
+    extent = Any(None).tag(sync=True)
+    "the collection, min_size, start and end of the last extraction"
+
+    path = Any(None).tag(sync=True)
+    "the autosave file of the last extraction, it keeps all the alerts and their reviews"
+
     ############################################################################
     # methods
     ############################################################################
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # the alerts are replaced by the background extraction while they can be
+        # reviewed, their read-modify-write are done under this lock
+        self.lock = threading.RLock()
+
     def get_ipygeojson(self):
         """return a ipygeojson layer ready to be displayed on the map"""
 
@@ -75,3 +103,88 @@ class AlertModel(model.Model):
         )
 
         return ipygeojson
+
+    def set_alerts(self, gdf, extent=None, path=None):
+        """
+        set the alerts of a new extraction. They are kept unfiltered to select them
+        again instantly if the min_size or the period are changed (see filter_alerts)
+
+        Args:
+            gdf (gpd.GeoDataFrame): the alerts indexed by id
+            extent (dict, optional): the collection, min_size, start and end of the
+                extraction. If None the alerts are never filtered
+            path (pathlib.Path, optional): the autosave file of the alerts, it
+                doesn't change with the filters
+        """
+
+        self.all_gdf = gdf.sort_values(by=["surface"], ascending=False, kind="stable")
+        self.extent = extent
+        self.path = path if path is not None else self.path
+
+        gdf = self.all_gdf.copy()
+        if extent is not None:
+            gdf = cs.filter_alerts(gdf, self.min_size)
+        self.gdf = gdf
+
+        return self
+
+    def filter_alerts(self):
+        """
+        select the alerts of the last extraction matching the current min_size and
+        period. The modifications made on the current alerts are kept.
+
+        Returns:
+            (bool): False if the current parameters are not covered by the last
+            extraction, a new one is then needed
+        """
+
+        if self.all_gdf is None or self.extent is None:
+            return False
+
+        # only smaller periods and bigger alerts can be selected without extraction
+        extent = self.extent
+        if (
+            None in [self.start, self.end, self.min_size]
+            or self.alert_collection != extent["collection"]
+            or self.min_size < extent["min_size"]
+            or self.start < extent["start"]
+            or self.end > extent["end"]
+        ):
+            return False
+
+        with self.lock:
+            self.all_gdf = cs.sync_alerts(self.all_gdf, self.gdf)
+            self.gdf = cs.filter_alerts(
+                self.all_gdf,
+                self.min_size,
+                self.start if self.start > extent["start"] else None,
+                self.end if self.end < extent["end"] else None,
+            )
+
+        return True
+
+    def save(self):
+        """
+        write all the alerts of the last extraction with their reviews in the
+        autosave file, including the ones hidden by the filters
+
+        Returns:
+            (pathlib.Path): the path to the file, None if nothing was extracted
+        """
+
+        if self.path is None or self.gdf is None:
+            return None
+
+        # the alerts being extracted are not filtered yet
+        with self.lock:
+            if self.all_gdf is not None:
+                self.all_gdf = cs.sync_alerts(self.all_gdf, self.gdf)
+            gdf = self.all_gdf if self.all_gdf is not None else self.gdf
+            cs.save_alerts(gdf, self.path)
+
+        return self.path
+
+    def get_path(self, aoi_name, format_="gpkg"):
+        """return the path of the result file of the current alerts"""
+
+        return cs.result_path(aoi_name, self.start, self.end, self.min_size, format_)
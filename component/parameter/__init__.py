@@ -1,4 +1,10 @@
+from importlib.util import find_spec
+
 from .directory import *
-from .gui import *
+
+# the styles of the map need the widgets, the headless runs don't install them
+if find_spec("sepal_ui") is not None:
+    from .gui import *
+
 from .alert import *
 from .planet import *
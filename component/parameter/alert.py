@@ -3,22 +3,58 @@ from component.message import cm
 
 now = date.today().year
 
+# the capabilities of each alert system:
+# - scale: native resolution (m) used to vectorize the alerts, None for the user assets
+# - date_encoding: how the dates are stored in the source, they are all converted
+#   to YYYY.julian_day by the drivers
+# - cadence: number of days between 2 updates of the dataset
+# - footprint: how to display the extent of the dataset, "collection" or "image" of
+#   the asset, "asset" for the image selected by the user
+# - raster: the outputs can also be read from a local GeoTIFF (see scripts/raster.py)
+# - available_years: the years that can be selected in the datepickers
+# the systems read from files have no driver. New drivers are added with
+# register_driver (see scripts/alert.py)
 alert_drivers = {
     "GLAD-L": {
         "available_years": range(2017, now + 1),
         "last_updated": 2022,
         "asset": "projects/glad/alert/UpdResult",
+        "live": True,
+        "scale": 30,
+        "date_encoding": "julian day of the year in yearly bands",
+        "cadence": 8,
+        "footprint": "collection",
     },
     "RADD": {
         "available_years": range(2019, now + 1),
         "asset": "projects/radar-wur/raddalert/v1",
+        "live": True,
+        "scale": 10,
+        "date_encoding": "YYDDD",
+        "cadence": 6,
+        "footprint": "collection",
+    },
+    "NRT": {
+        "scale": None,
+        "date_encoding": "decimal year",
+        "footprint": "asset",
+        "raster": True,
     },
-    "NRT": {},
     "GLAD-S": {
         "available_years": range(2018, now + 1),
         "asset": "projects/glad/S2alert/alert",
+        "live": True,
+        "scale": 10,
+        "date_encoding": "days since 2018-12-31",
+        "cadence": 5,
+        "footprint": "image",
+    },
+    "CUSUM": {
+        "scale": None,
+        "date_encoding": "YYYY.julian_day",
+        "footprint": "asset",
+        "raster": True,
     },
-    "CUSUM": {},
     "SINGLE-DATE": {},
     "RECOVER": {},
     "JJ-FAST": {"available_years": range(2016, now + 1)},
@@ -30,3 +66,95 @@ time_delta = [
     {"text": cm.parameter.time_delta.week, "value": 7},
     {"text": cm.parameter.time_delta.month, "value": 31},
 ]
+
+# the maximal number of grid cells requested to GEE at the same time
+max_workers = 8
+
+# the size of the initial grid cells in degrees. Cells that are too big to be computed
+# by GEE are split in 4 up to max_split_depth times
+grid_size = 0.5
+max_split_depth = 4
+
+# GEE error messages that are solved by reducing the size of the requested cell.
+# only the server computation timeout is a size issue, not the network ones
+split_errors = [
+    "computation timed out",
+    "memory limit",
+    "too many pixels",
+    "too many features",
+    "too many elements",
+    "accumulating over",
+    "request size",
+]
+
+# GEE error messages of temporary failures that are retried with an exponential backoff
+# (in seconds) randomized between 0 and min(backoff_cap, backoff_base * 2**attempt)
+retry_errors = [
+    "429",
+    "too many requests",
+    "too many concurrent",
+    "quota",
+    "rate limit",
+    "internal error",
+    "service unavailable",
+    "503",
+    "timed out",
+]
+max_retries = 5
+backoff_base = 2
+backoff_cap = 60
+
+# tileScale of the reduction used to skip the empty cells, it's made at the native
+# scale of the collection
+screen_tile_scale = 4
+
+# scale (in meters) of the pixel count of the extraction estimator and number of
+# cell durations kept for each collection to predict the time of the next runs
+estimate_scale = 300
+max_latencies = 200
+
+# time (in seconds) after which a cell claimed by a queue worker is considered abandoned
+# (crashed or killed worker) and can be claimed again
+claim_timeout = 30 * 60
+
+# minimal time (in seconds) between 2 updates of the map while the cells are loading
+render_interval = 5
+
+# the on-disk cache of the extracted cells
+# max size in bytes, the least recently used cells are removed first
+cache_max_size = 2 * 1024**3
+
+# the pixels of the cells vectorized locally are kept as well to re-vectorize them
+# with another mmu or a narrower period without any request to GEE
+tile_cache_max_size = 5 * 1024**3
+
+# version of the extraction pipeline, bump it when the content of the cells changes
+cache_version = 3
+
+# time to live (in days) of the cached cells. "live" datasets are still updated
+# and can change the alerts of the last live_window days
+cache_ttl = {"live": 1, "static": 90}
+cache_live_window = 180
+
+# the vectorization of the cells is done by GEE ("gee") or by downloading the pixels
+# and labeling them locally on all the CPU cores ("local")
+vectorization_backends = [
+    {"text": "Earth Engine", "value": "gee"},
+    {"text": "Local", "value": "local"},
+]
+vectorization_backend = "gee"
+
+# the resolution (m) of the vectorization of the drivers without native scale and the
+# constants to compute the pixel sizes and areas in EPSG:4326
+default_scale = 30
+degree_length = 111320
+earth_radius = 6371008.8
+
+# relative surface increase (0.05 = 5%) above which an alert matching an alert of the
+# previous monitoring run is flagged as grown
+grown_tolerance = 0.05
+
+# the ids of the alerts are a hash of their date and of their coordinates snapped on a
+# grid of id_precision degrees (~10cm) so that the same alert always gets the same id
+id_precision = 1e-6
+id_size = 8
@@ -8,3 +8,23 @@ module_dir.mkdir(exist_ok=True)
 
 result_dir = module_dir.joinpath("alerts_results")
 result_dir.mkdir(exist_ok=True)
+
+cache_dir = result_dir.joinpath("cache")
+cache_dir.mkdir(exist_ok=True)
+
+# the raw pixels of the cells extracted with the local vectorization
+tile_dir = cache_dir.joinpath("tiles")
+tile_dir.mkdir(exist_ok=True)
+
+# the last extraction of each aoi/collection pair used by the incremental mode
+increment_file = result_dir.joinpath("increments.json")
+
+# the persistent queue of the cells extracted by the workers
+queue_file = result_dir.joinpath("queue.sqlite")
+
+# the durations of the cells requested in previous runs used by the estimator
+latency_file = result_dir.joinpath("latencies.json")
+
+# the baselines, deltas and summaries of the monitoring runs
+monitor_dir = result_dir.joinpath("monitor")
+monitor_dir.mkdir(exist_ok=True)
@@ -1,3 +1,15 @@
 from .alert import *
 from .planet import *
 from .grid import *
+from .extraction import *
+from .cache import *
+from .incremental import *
+from .filtering import *
+from .vectorize import *
+from .raster import *
+from .estimate import *
+from .profiler import *
+from .jobs import *
+from .work_queue import *
+from .batch import *
+from .monitor import *
@@ -1,54 +1,104 @@
-from datetime import date, datetime
+from datetime import datetime
+from functools import lru_cache
+import hashlib
 import json
 from pathlib import Path
 from math import floor, ceil
 from itertools import product
+from typing import TYPE_CHECKING
 import requests
-from math import pi, sqrt
 
 import geopandas as gpd
 import ee
 import pandas as pd
+import shapely
 
 from component import parameter as cp
 from component.message import cm
-from component.widget.custom_alert import Alert
 
-from .utils import to_date
+from .utils import to_date_lut
 
+# the widgets are not needed to run the extraction without the application
+if TYPE_CHECKING:
+    from component.widget.custom_alert import Alert
+    from .jobs import Job
 
-def get_alerts_clump(alerts: ee.Image, aoi, mmu: int):
+# the functions building the alert image of each collection
+_readers = {}
+
+
+def register_driver(name):
+    """
+    decorator registering the function that builds the alert image of a collection.
+    The function is called with the start, end, aoi and asset of the analysis.
+    The capabilities of the collection are set in cp.alert_drivers.
+
+    Args:
+        name (str): the collection name
+
+    Returns:
+        (callable): the decorator
+    """
+
+    def decorator(reader):
+        _readers[name] = reader
+        return reader
+
+    return decorator
+
+
+def gee_collections():
+    """return the names of the collections extracted from GEE"""
+
+    return list(_readers)
+
+
+def get_scale(collection):
+    """return the native resolution (m) of a collection"""
+
+    return cp.alert_drivers.get(collection, {}).get("scale") or cp.default_scale
+
+
+def get_alerts_clump(alerts: ee.Image, aoi, mmu: int, scale=cp.default_scale):
     """
     Transform the Image into a featureCollection of agregated alert
-    Import it into SEPAL as a GeoJson dict.
+    Each feature embeds its label, surface (ha), date, date_max, alert and pixels.
 
     Args:
         alerts: the refactored alerts with an adapted masked to the requested dates
         aoi (ee.FeatureCollection): the featureCollection of the selected AOI
         mmu: minimal mapping unit
+        scale (int): the native resolution of the alerts (m)
 
     Return:
-        (dict): a geojson dict
+        (ee.FeatureCollection): the alert polygons
     """
 
     # connectedComponent will analysie all pixels, masked included so it's important
     # to cut the image before starting the object based analysis.
     # clip is not sufficient as it doesn't change the footprint of the image
-    alerts = alerts.clipToBoundsAndScale(
-        geometry=aoi.geometry(),
-        scale=30,
-    )
-
-    # remove very small patches from the vectorization step to avoid overloading GEE
-    # mmu is given in ha, I'll be using the corresponding number of pixels for a 30m resolution raster
-    # it's too big for sentinel based dataset but that will still filter things
-    mmu = int(sqrt((mmu * (10**6)) / pi) / 30)
-    mask = (
+    # the alerts are kept at their native resolution to avoid oversampling them
+    alerts = alerts.clipToBoundsAndScale(geometry=aoi.geometry(), scale=scale)
+
+    # remove the patches smaller than the mmu from the vectorization step to avoid
+    # overloading GEE and downloading polygons that would be filtered anyway.
+    # mmu is given in ha, it's compared to the true area of the connected alert pixels.
+    # objects wider than maxSize have no area, they are bigger than any mmu
+    patches = (
         alerts.select("alert")
         .gt(0)
-        .connectedPixelCount(ee.Number(mmu).add(2))
-        .gte(ee.Number(mmu))
+        .selfMask()
+        .connectedComponents(connectedness=ee.Kernel.square(1), maxSize=1024)
     )
+    area = (
+        ee.Image.pixelArea()
+        .reproject(patches.projection())
+        .addBands(patches.select("labels"))
+        .reduceConnectedComponents(
+            reducer=ee.Reducer.sum(), labelBand="labels", maxSize=1024
+        )
+    )
+    mask = area.gte(ee.Number(mmu).multiply(10**4)).unmask(1)
     alerts = alerts.updateMask(mask)
 
     # Uniquely label the alert image objects.
@@ -56,19 +106,62 @@ def get_alerts_clump(alerts: ee.Image, aoi, mmu: int):
         connectedness=ee.Kernel.square(1), maxSize=1024  # 8 neighbors
     )
 
-    # reduce to vector
-    alert_collection = object_id.reduceToVectors(
-        reducer=ee.Reducer.min(),  # confirmed are 1, and potential 2
-        scale=20,  # force scale < nominalScale to obtain correct results
+    # the attributes of each polygon are computed during the vectorization with a
+    # single combined reducer. The first band holds the object labels, the other ones
+    # are consumed in order by the reducers:
+    # surface (ha), first date, last date, confidence and number of pixels
+    bands = (
+        object_id.select("labels")
+        .addBands(ee.Image.pixelArea().divide(10**4))
+        .addBands(alerts.select("date"))
+        .addBands(alerts.select("date"))
+        .addBands(alerts.select("alert"))  # confirmed are 1, and potential 2
+        .addBands(alerts.select("alert"))
+    )
+    reducer = (
+        ee.Reducer.sum()
+        .combine(ee.Reducer.min(), outputPrefix="date_", sharedInputs=False)
+        .combine(ee.Reducer.max(), outputPrefix="date_", sharedInputs=False)
+        .combine(ee.Reducer.min(), outputPrefix="alert_", sharedInputs=False)
+        .combine(ee.Reducer.count(), outputPrefix="pixel_", sharedInputs=False)
+        .setOutputs(["surface", "date", "date_max", "alert", "pixels"])
+    )
+
+    # reduce to vector in the grid of the clipped alerts so that the polygons follow
+    # the labeled pixels
+    alert_collection = bands.reduceToVectors(
+        reducer=reducer,
+        crs=alerts.projection(),
+        scale=scale,
         eightConnected=True,
         bestEffort=True,
-        labelProperty="labels",
+        labelProperty="label",
         geometry=aoi.geometry(),
     )
 
     return alert_collection
 
 
+@lru_cache(maxsize=32)
+def get_alert_image(collection, start, end, asset):
+    """
+    get the global alert image of a collection for the specified dates.
+    The image graph is built once per set of parameters and shared by all the cells
+    of the grid that only need to clip it (see get_alerts_clump).
+
+    Args:
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        asset (str): the asset Id of the Image
+
+    Returns:
+        (ee.Image) the alert Image
+    """
+
+    return get_alerts(collection, start, end, None, asset)
+
+
 def get_alerts(collection, start, end, aoi, asset):
     """
     get the alerts restricted to the aoi and the specified dates.
@@ -81,93 +174,78 @@ def get_alerts(collection, start, end, aoi, asset):
         collection (str): the collection name
         start (str): the start of the analysis (YYYY-MM-DD)
         end (str): the end day of the analysis (YYYY-MM-DD)
-        aoi (ee.FeatureCollection): the selected aoi
+        aoi (ee.FeatureCollection): the selected aoi, None to get the global image
         asset (str): the asset Id of the Image
 
     Returns:
         (ee.Image) the alert Image
     """
 
-    if collection == "GLAD-L":
-        alerts = _from_glad_l(start, end, aoi)
-    elif collection == "RADD":
-        alerts = _from_radd(start, end, aoi)
-    elif collection == "NRT":
-        alerts = _from_nrt(aoi, asset)
-    elif collection == "GLAD-S":
-        alerts = _from_glad_s(start, end, aoi)
-    elif collection == "CUSUM":
-        alerts = _from_cusum(aoi, asset)
-    else:
+    if collection not in _readers:
         raise Exception(cm.alert.wrong_collection.format(collection))
 
+    alerts = _readers[collection](start, end, aoi, asset)
+
     return alerts
 
 
-def _from_glad_l(start, end, aoi):
+@register_driver("GLAD-L")
+def _from_glad_l(start, end, aoi, asset=None):
     """reformat the glad alerts to fit the module expectation"""
 
     # glad is not compatible with multi year analysis so we cut the dataset into
-    # yearly pieces and merge thm together in a second step
-    # as it includes multiple dataset I'm not sure I can perform it without a python for loop
-
-    # cut the interval into yearly pieces
-    start = datetime.strptime(start, "%Y-%m-%d")
-    end = datetime.strptime(end, "%Y-%m-%d")
+    # yearly pieces and merge them together in a second step.
+    # the pieces are built server-side by mapping over the years so that the size
+    # of the request doesn't grow with the number of years
+    start, end = ee.Date(start), ee.Date(end)
+    last_updated = cp.alert_drivers["GLAD-L"]["last_updated"]
+
+    def yearly_alerts(year):
+        year = ee.Number(year).int()
+        suffix = year.mod(100).format("%d")
+
+        # the finalized years are stored in their own collection
+        source = ee.Algorithms.If(
+            year.lt(last_updated),
+            ee.String("projects/glad/alert/").cat(year.format("%d")).cat("final"),
+            "projects/glad/alert/UpdResult",
+        )
 
-    periods = [[start, end]]
-    tmp = periods.pop()
-    while tmp[0].year != tmp[1].year:
-        year = tmp[0].year
-        periods.append([tmp[0], date(year, 12, 31)])
-        periods.append([date(year + 1, 1, 1), tmp[1]])
-        tmp = periods.pop()
-    periods.append(tmp)
-
-    images = []
-    for period in periods:
-        year = period[0].year
-        start = period[0].timetuple().tm_yday
-        end = period[1].timetuple().tm_yday
-
-        if year < cp.alert_drivers["GLAD-L"]["last_updated"]:
-            source = f"projects/glad/alert/{year}final"
-        else:
-            source = "projects/glad/alert/UpdResult"
+        # cut the interval to the current year and extract the julian days
+        first_day = ee.Date.fromYMD(year, 1, 1).millis().max(start.millis())
+        last_day = ee.Date.fromYMD(year, 12, 31).millis().min(end.millis())
+        first_day = ee.Date(first_day).getRelative("day", "year").add(1)
+        last_day = ee.Date(last_day).getRelative("day", "year").add(1)
 
         # the number of bands throughout the ImageCollection is not consisitent
         # remove the extra useless one before any operation
-        bands = [f"conf{year%100}", f"alertDate{year%100}", "obsCount", "obsDate"]
+        conf = ee.String("conf").cat(suffix)
+        alert_date = ee.String("alertDate").cat(suffix)
+        bands = ee.List([conf, alert_date, "obsCount", "obsDate"])
 
         # create the composit band alert_date.
         # cannot use the alertDateXX band directly because
-        # they are not all casted to the same type
-        alerts = (
-            ee.ImageCollection(source)
-            .select(bands)
-            .map(lambda image: image.uint16())
-            .filterBounds(aoi)
-            .mosaic()
-            .clip(aoi)
-        )
+        # they are not all casted to the same type.
+        # The source is filtered before casting its images
+        alerts = ee.ImageCollection.load(ee.String(source))
+        alerts = alerts if aoi is None else alerts.filterBounds(aoi)
+        alerts = alerts.select(bands).map(lambda image: image.uint16()).mosaic()
         alerts = alerts.updateMask(
-            alerts.select(f"alertDate{year%100}")
-            .gt(start)
-            .And(alerts.select(f"alertDate{year%100}").lt(end))
+            alerts.select(alert_date)
+            .gt(first_day)
+            .And(alerts.select(alert_date).lt(last_day))
         )
 
         # create a unique alert band
         alert_band = (
-            alerts.select(f"conf{year%100}")
-            .remap([0, 1, 2, 3], [0, 0, 2, 1])
-            .rename("alert")
+            alerts.select(conf).remap([0, 1, 2, 3], [0, 0, 2, 1]).rename("alert")
         )
 
         # change the date format
         date_band = (
-            alerts.select(f"alertDate{year%100}")
+            alerts.select(alert_date)
             .divide(1000)
-            .add(ee.Image(year))
+            .add(ee.Image.constant(year))
             .rename("date")
         )
 
@@ -178,14 +256,17 @@ def _from_glad_l(start, end, aoi):
             .addBands(alert_band)
         )
 
-        images += [composite]
+        return composite
 
-    all_alerts = ee.ImageCollection.fromImages(images).mosaic()
+    years = ee.List.sequence(start.get("year"), end.get("year"))
+    all_alerts = ee.ImageCollection.fromImages(years.map(yearly_alerts)).mosaic()
+    all_alerts = all_alerts if aoi is None else all_alerts.clip(aoi)
 
     return all_alerts
 
 
-def _from_radd(start, end, aoi):
+@register_driver("RADD")
+def _from_radd(start, end, aoi, asset=None):
     """reformat the radd alerts to fit the module expectation"""
 
     # extract dates from parameters
@@ -194,13 +275,9 @@ def _from_radd(start, end, aoi):
 
     # select the alerts and mosaic them as image
     source = "projects/radar-wur/raddalert/v1"
-    alerts = (
-        ee.ImageCollection(source)
-        .filterBounds(aoi)
-        .filterMetadata("layer", "contains", "alert")
-        .mosaic()
-        .uint16()
-    )
+    alerts = ee.ImageCollection(source)
+    alerts = alerts if aoi is None else alerts.filterBounds(aoi)
+    alerts = alerts.filterMetadata("layer", "contains", "alert").mosaic().uint16()
 
     # filter the alerts dates
     # extract julian dates ()
@@ -226,7 +303,8 @@ def _from_radd(start, end, aoi):
     return all_alerts
 
 
-def _from_nrt(aoi, asset):
+@register_driver("NRT")
+def _from_nrt(start, end, aoi, asset):
     "reformat andreas alert sytem to be compatible with the rest of the apps"
 
     # read the image
@@ -257,7 +335,8 @@ def _from_nrt(aoi, asset):
     return all_alerts
 
 
-def _from_glad_s(start, end, aoi):
+@register_driver("GLAD-S")
+def _from_glad_s(start, end, aoi, asset=None):
     """reformat the glad-s alerts to fit the module expectation"""
 
     # extract dates from parameters
@@ -283,7 +362,7 @@ def _from_glad_s(start, end, aoi):
     ).rename("alert")
 
     # change the date format
-    date_band = to_date(date_band).rename("date")
+    date_band = to_date_lut(date_band).rename("date")
 
     # create the composit image
     all_alerts = alert_band.addBands(date_band)
@@ -291,7 +370,8 @@ def _from_glad_s(start, end, aoi):
     return all_alerts
 
 
-def _from_cusum(aoi, asset):
+@register_driver("CUSUM")
+def _from_cusum(start, end, aoi, asset):
     "reformat andreas CUSUM alert sytem to be compatible with the rest of the apps"
 
     # read the image
@@ -317,6 +397,94 @@ def _from_cusum(aoi, asset):
     return all_alerts
 
 
+def alert_ids(gdf):
+    """
+    compute the ids of alerts from their geometry and date. The coordinates are
+    snapped and normalized first so that the same polygon extracted in another run,
+    cell or session gets the same id
+
+    Args:
+        gdf (gpd.GeoDataFrame): the alerts with a date column
+
+    Returns:
+        (pd.Series): the hexadecimal ids of the alerts
+    """
+
+    geoms = shapely.set_precision(gdf.geometry.to_numpy(), cp.id_precision)
+    wkbs = shapely.to_wkb(shapely.normalize(geoms))
+    dates = gdf["date"].round(3).to_numpy()
+
+    ids = [
+        hashlib.blake2b(f"{d:.3f}".encode() + w, digest_size=cp.id_size).hexdigest()
+        for w, d in zip(wkbs, dates)
+    ]
+
+    return pd.Series(ids, index=gdf.index)
+
+
+def prepare_alerts(gdf):
+    """
+    set the review columns and the ids of newly extracted alerts
+
+    Args:
+        gdf (gpd.GeoDataFrame): the extracted alerts
+
+    Returns:
+        (gpd.GeoDataFrame): the alerts sorted by decreasing surface, indexed by id
+    """
+
+    gdf["review"] = cm.view.metadata.status.unset
+    gdf["comment"] = ""  # add a comment column with empty string
+    gdf = gdf.sort_values(by=["surface"], ignore_index=True, ascending=False)
+
+    # the ids only depend on the alert so they are kept between runs
+    gdf["id"] = alert_ids(gdf)
+    gdf = gdf.drop_duplicates(subset="id")
+    gdf.index = gdf["id"].to_numpy()
+    gdf["original_geometry"] = gdf["geometry"].apply(lambda g: g.__geo_interface__)
+
+    return gdf
+
+
+def result_path(aoi_name, start, end, min_size, format_="gpkg", folder=cp.result_dir):
+    """
+    build the path of the result file of an extraction, shared by the application
+    and the headless runs
+
+    Args:
+        aoi_name (str): the name of the aoi
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        min_size: minimal mapping unit
+        format_ (str): the extension of the file
+        folder (pathlib.Path): the folder of the result files
+
+    Returns:
+        (pathlib.Path): the path to the file
+    """
+
+    return Path(folder) / f"{aoi_name}_{start}_{end}_{min_size}.{format_}"
+
+
+def save_alerts(gdf, path):
+    """
+    save the alerts in a gpkg file that can be read back with from_recover
+
+    Args:
+        gdf (gpd.GeoDataFrame): the alerts
+        path (pathlib.Path): the destination file
+
+    Returns:
+        (pathlib.Path): the path to the file
+    """
+
+    gdf = gdf.copy()
+    gdf["original_geometry"] = gdf["original_geometry"].apply(json.dumps)
+    gdf.to_file(path, layer=cm.map.layer.alerts, driver="GPKG", index=False)
+
+    return path
+
+
 def from_single_date(path: Path, date: str) -> gpd.GeoDataFrame:
     """retreive the alerts from a single date file of any type recognized by fiona"""
 
@@ -352,13 +520,23 @@ def from_recover(path):
     # rewrite the original_geometry as a dict instead of a string
     gdf["original_geometry"] = gdf["original_geometry"].apply(lambda g: json.loads(g))
 
+    # the alerts are accessed by id in the rest of the application
+    gdf.index = gdf["id"].to_numpy()
+
     return gdf
 
 
 def from_jj_fast(
-    start: str, end: str, aoi: gpd.GeoDataFrame, alert: Alert
+    start: str,
+    end: str,
+    aoi: gpd.GeoDataFrame,
+    alert: "Alert | None" = None,
+    job: "Job | None" = None,
 ) -> gpd.GeoDataFrame:
-    """Read the jj-fast alerts from the online API"""
+    """
+    Read the jj-fast alerts from the online API. The job is paused or stopped
+    between the tiles
+    """
 
     # init geojson
     data = {"type": "FeatureCollection", "features": []}
@@ -381,10 +559,14 @@ def from_jj_fast(
     nb_tile = len([i for i in product(range(minx, maxx), range(miny, maxy))])
 
     # loop through every days
-    alert.set_total(nb_tile * nb_dates)
+    if alert is not None:
+        alert.set_total(nb_tile * nb_dates)
     for i, day in enumerate(pd.date_range(start, end)):
         # loop through tiles
         for j, (x, y) in enumerate(product(range(minx, maxx), range(miny, maxy))):
+            if job is not None:
+                job.checkpoint()
+
             # get the tile geojson link
             req = requests.get(url.format(y + 0.5, x + 0.5, day.strftime("%Y%m%d")))
 
@@ -408,7 +590,8 @@ def from_jj_fast(
 
                     # add them to the geojson with correct alerts dates
                     data["features"].append(feat)
-            alert.update_progress()
+            if alert is not None:
+                alert.update_progress()
             # alert.update_progress(((i * nb_tile) + j) / (nb_tile * nb_dates))
 
     # transform geojson into a dataframe
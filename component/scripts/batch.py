@@ -0,0 +1,342 @@
+"""
+Headless extraction of the alerts, used by the application and by scheduled jobs.
+
+    python -m component.cli.batch aois.gpkg RADD 2023-01-01 2023-06-30 --mmu 1
+
+Each feature of the aoi file is extracted in its own process and saved as a gpkg
+file that can be opened in the application with the RECOVER collection.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import partial
+import multiprocessing
+
+import ee
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from component import parameter as cp
+from component.message import cm
+
+from .alert import (
+    get_alert_image,
+    get_scale,
+    from_jj_fast,
+    prepare_alerts,
+    save_alerts,
+    result_path,
+)
+from .cache import CellCache, TileCache, cell_key, tile_key, cache_ttl, to_entry
+from .estimate import record_latencies
+from .extraction import fetch_cell, extract_cells
+from .grid import set_grid, split_cell, screen_grid
+from .profiler import profile_stage
+from .raster import fetch_raster_cell
+
+
+def _gather(results):
+    """gather the alerts of the extracted cells in a single dataframe"""
+
+    # every cell can fail
+    if len(results) == 0:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    return gpd.GeoDataFrame(pd.concat(results, ignore_index=True), crs="EPSG:4326")
+
+
+def _vectorization_pool(enabled=True):
+    """
+    create the process pool of the local vectorization, a null context if it's not
+    needed. The workers are started on the first submission from the threads of
+    extract_cells so they are spawned instead of forked from a multi-threaded process
+    """
+
+    if enabled is False:
+        return nullcontext()
+
+    return ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+
+
+def extract_alerts(
+    aoi_gdf,
+    collection,
+    start,
+    end,
+    mmu,
+    asset=None,
+    backend=cp.vectorization_backend,
+    alert=None,
+    profiler=None,
+    on_result=None,
+    job=None,
+):
+    """
+    extract the alerts of a GEE collection over an aoi using a grid. The cells are
+    read from the cache, screened to skip the empty ones and requested concurrently.
+
+    Args:
+        aoi_gdf (gpd.GeoDataFrame): the aoi
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        mmu: minimal mapping unit
+        asset (str, optional): the asset Id of the Image
+        backend (str): the vectorization backend
+        alert (Alert, optional): the alert to display the progress and the warnings
+        profiler (Profiler, optional): records the duration of each stage
+        on_result (callable, optional): called with the alerts of each extracted cell
+        job (Job, optional): the background job running the extraction
+
+    Returns:
+        (gpd.GeoDataFrame, list): the alerts and the (cell, error) of the failed cells
+    """
+
+    # create the grid
+    with profile_stage(profiler, "grid") as stage:
+        grid = set_grid(aoi_gdf)
+        stage["cells"] = len(grid)
+
+    # the cells extracted in previous runs are read from the cache
+    cache = CellCache()
+    ttl = cache_ttl(collection, end)
+    keys = [
+        cell_key(collection, asset, g, start, end, mmu, backend) for g in grid.geometry
+    ]
+    missing = np.array([not cache.contains(k, ttl) for k in keys], dtype=bool)
+
+    # the cells vectorized locally can be rebuilt from the pixels of a previous run
+    # if only the mmu changed or if the period is narrower
+    tiles = TileCache() if backend == "local" else None
+    tile_keys = [tile_key(collection, asset, g) for g in grid.geometry]
+    if tiles is not None:
+        for i in np.flatnonzero(missing):
+            missing[i] = not tiles.covers(tile_keys[i], start, end, ttl)
+
+    # count the alert pixels of all the missing cells at once and only vectorize
+    # the ones that contain alerts. If the count fails, every cell is kept.
+    # The count is made at the native scale so that isolated pixels are not lost
+    # in the pyramids and the empty cells can be cached
+    all_alerts = get_alert_image(collection, start, end, asset)
+    if job is not None:
+        job.checkpoint()
+    try:
+        if missing.any():
+            empty = gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+            keep = np.invert(missing)
+            with profile_stage(profiler, "screen", cells=int(missing.sum())):
+                counts = screen_grid(all_alerts, grid[missing], get_scale(collection))
+                keep[missing] = counts > 0
+
+            # the empty cells are cached as well to skip them in the next runs
+            for i in np.flatnonzero(np.invert(keep)):
+                cache.set(keys[i], to_entry(empty))
+                if tiles is not None:
+                    tiles.set_empty(tile_keys[i], start, end)
+
+            grid = grid[keep]
+    except ee.EEException as e:
+        if alert is not None:
+            alert.add_msg(cm.view.alert.error.screen.format(e), "warning")
+
+    # exit if nothing is found
+    if len(grid) == 0:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326"), []
+
+    # the grid avoids timeout in the define AOI
+    # its cells are requested concurrently to GEE and split if they are too big
+    # the local vectorization of the cells is spread on all the CPU cores
+    if alert is not None:
+        alert.set_total(len(grid))
+    latencies = []
+    with _vectorization_pool(backend == "local") as executor:
+        fetch = partial(
+            fetch_cell,
+            collection=collection,
+            start=start,
+            end=end,
+            asset=asset,
+            mmu=mmu,
+            cache=cache,
+            backend=backend,
+            executor=executor,
+            tiles=tiles,
+            latencies=latencies,
+            profiler=profiler,
+        )
+        results, failed = extract_cells(
+            grid.geometry,
+            fetch,
+            alert=alert,
+            split=split_cell,
+            profiler=profiler,
+            on_result=on_result,
+            job=job,
+        )
+    cache.evict()
+    record_latencies(collection, backend, latencies)
+    if tiles is not None:
+        tiles.evict()
+
+    # gather the cells in a single dataframe
+    # the surface of each polygon (ha) is already computed by GEE
+    return _gather(results), failed
+
+
+def extract_raster_alerts(
+    aoi_gdf, path, collection, mmu, alert=None, profiler=None, on_result=None, job=None
+):
+    """
+    extract the alerts of a local NRT or CUSUM raster over an aoi using a grid.
+    The file is read cell by cell to keep the memory footprint of large rasters
+    under control and the cells are vectorized on all the CPU cores
+
+    Args:
+        aoi_gdf (gpd.GeoDataFrame): the aoi
+        path (str): the path to the GeoTIFF file
+        collection (str): "NRT" or "CUSUM"
+        mmu: minimal mapping unit
+        alert (Alert, optional): the alert to display the progress
+        profiler (Profiler, optional): records the duration of each stage
+        on_result (callable, optional): called with the alerts of each extracted cell
+        job (Job, optional): the background job running the extraction
+
+    Returns:
+        (gpd.GeoDataFrame, list): the alerts and the (cell, error) of the failed cells
+    """
+
+    grid = set_grid(aoi_gdf)
+
+    if alert is not None:
+        alert.set_total(len(grid))
+    with _vectorization_pool() as executor:
+        fetch = partial(
+            fetch_raster_cell,
+            path=path,
+            collection=collection,
+            mmu=mmu,
+            executor=executor,
+        )
+        results, failed = extract_cells(
+            grid.geometry,
+            fetch,
+            alert=alert,
+            profiler=profiler,
+            on_result=on_result,
+            job=job,
+        )
+
+    return _gather(results), failed
+
+
+def run_aoi(
+    aoi_gdf,
+    name,
+    collection,
+    start,
+    end,
+    mmu,
+    folder=cp.result_dir,
+    asset=None,
+    backend=cp.vectorization_backend,
+    raster=None,
+):
+    """
+    extract the alerts of an aoi and save them in a gpkg file named like the
+    autosave of the application
+
+    Args:
+        aoi_gdf (gpd.GeoDataFrame): the aoi
+        name (str): the name of the aoi
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        mmu: minimal mapping unit
+        folder (pathlib.Path): the folder of the result files
+        asset (str, optional): the asset Id of the Image
+        backend (str): the vectorization backend
+        raster (str, optional): a local NRT or CUSUM file used instead of the asset
+
+    Returns:
+        (pathlib.Path, int): the path to the file (None if no alert was found) and
+        the number of failed cells
+    """
+
+    failed = []
+    if collection == "JJ-FAST":
+        gdf = from_jj_fast(start, end, aoi_gdf)
+    elif raster is not None:
+        gdf, failed = extract_raster_alerts(aoi_gdf, raster, collection, mmu)
+    else:
+        gdf, failed = extract_alerts(
+            aoi_gdf, collection, start, end, mmu, asset, backend
+        )
+
+    if len(gdf) > 0:
+        gdf = gdf[gdf.surface >= mmu]
+    if len(gdf) == 0:
+        return None, len(failed)
+
+    gdf = prepare_alerts(gdf)
+    path = result_path(name, start, end, mmu, folder=folder)
+
+    return save_alerts(gdf, path), len(failed)
+
+
+def _run_aoi(geometry, name, *args, **kwargs):
+    """run an aoi in a worker process of the batch"""
+
+    aoi_gdf = gpd.GeoDataFrame(geometry=[geometry], crs="EPSG:4326")
+
+    return run_aoi(aoi_gdf, name, *args, **kwargs)
+
+
+def run_batch(
+    path,
+    collection,
+    start,
+    end,
+    mmu,
+    name_column=None,
+    processes=None,
+    folder=cp.result_dir,
+    **kwargs,
+):
+    """
+    extract the alerts of every feature of an aoi file in parallel processes
+
+    Args:
+        path (str): the path to the aoi file (any format readable by geopandas)
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        mmu: minimal mapping unit
+        name_column (str, optional): the column naming the aois, default to the index
+        processes (int, optional): the number of aois extracted at the same time
+        folder (pathlib.Path): the folder of the result files
+        kwargs: the asset, backend or raster of the extraction
+
+    Returns:
+        (dict): the path and the number of failed cells (or the error) of each aoi
+    """
+
+    aois = gpd.read_file(path).to_crs("EPSG:4326")
+    names = aois.index if name_column is None else aois[name_column]
+
+    # every process needs its own connection to GEE
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=processes, initializer=ee.Initialize) as pool:
+        futures = {
+            pool.submit(
+                _run_aoi, g, str(n), collection, start, end, mmu, folder, **kwargs
+            ): str(n)
+            for n, g in zip(names, aois.geometry)
+        }
+        for future in as_completed(futures):
+            try:
+                outputs[futures[future]] = future.result()
+            except Exception as e:
+                outputs[futures[future]] = e
+
+    return outputs
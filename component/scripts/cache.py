@@ -0,0 +1,278 @@
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio as rio
+from rasterio.transform import Affine
+from shapely import wkt
+
+from component import parameter as cp
+
+from .alert import get_scale
+
+
+def cell_key(collection, asset, geom, start, end, mmu, backend="gee"):
+    """
+    build the unique key of an extracted cell
+
+    Args:
+        collection (str): the collection name
+        asset (str): the asset Id of the Image
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        mmu: minimal mapping unit
+        backend (str): the vectorization backend
+
+    Returns:
+        (str): the sha256 hash of the parameters
+    """
+
+    # the geometry is rounded to avoid floating point noise between runs
+    geom = wkt.dumps(geom, rounding_precision=7)
+    params = [cp.cache_version, collection, asset, geom, start, end, mmu, backend]
+    params = json.dumps(params)
+
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def tile_key(collection, asset, geom):
+    """
+    build the unique key of the pixels of a cell. It doesn't depend on the mmu
+    and the period as they can be applied locally (see filter_period)
+
+    Args:
+        collection (str): the collection name
+        asset (str): the asset Id of the Image
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+
+    Returns:
+        (str): the sha256 hash of the parameters
+    """
+
+    geom = wkt.dumps(geom, rounding_precision=7)
+    params = [cp.cache_version, collection, asset, geom, get_scale(collection)]
+    params = json.dumps(params)
+
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def cache_ttl(collection, end):
+    """
+    get the time to live of an extracted cell in seconds. It's short if the collection
+    is still updated in the requested period and long otherwise
+
+    Args:
+        collection (str): the collection name
+        end (str): the end day of the analysis (YYYY-MM-DD)
+
+    Returns:
+        (float): the ttl in seconds
+    """
+
+    end = datetime.strptime(end, "%Y-%m-%d")
+    window = datetime.today() - timedelta(days=cp.cache_live_window)
+
+    live = cp.alert_drivers[collection].get("live", False) and end > window
+    ttl = cp.cache_ttl["live" if live else "static"]
+
+    return timedelta(days=ttl).total_seconds()
+
+
+def to_entry(gdf):
+    """
+    serialize the alerts of a cell as a columnar cache entry
+
+    Args:
+        gdf (gpd.GeoDataFrame): the alerts of the cell
+
+    Returns:
+        (dict): the properties as lists and the geometries as hex wkb
+    """
+
+    return {
+        "table": {c: gdf[c].tolist() for c in gdf.columns if c != "geometry"},
+        "geometry": gdf.geometry.to_wkb(hex=True).tolist(),
+    }
+
+
+def from_entry(entry):
+    """
+    read back the alerts of a cell from a cache entry
+
+    Args:
+        entry (dict): the entry built with to_entry
+
+    Returns:
+        (gpd.GeoDataFrame): the alerts of the cell
+    """
+
+    geometry = gpd.GeoSeries.from_wkb(entry["geometry"], crs="EPSG:4326")
+
+    return gpd.GeoDataFrame(entry["table"], geometry=geometry)
+
+
+class CellCache:
+    """
+    on-disk cache of the extracted cells. Each cell is stored as a compressed json file.
+    The modification time of the file is the creation of the entry and the access
+    time is used to remove the least recently used entries
+    """
+
+    def __init__(
+        self, folder=cp.cache_dir, max_size=cp.cache_max_size, suffix=".json.gz"
+    ):
+        self.folder = folder
+        self.max_size = max_size
+        self.suffix = suffix
+
+    def path(self, key):
+        """return the path to the file of a key"""
+
+        return self.folder / f"{key}{self.suffix}"
+
+    def contains(self, key, ttl):
+        """check if a valid entry exist for this key"""
+
+        path = self.path(key)
+
+        return path.is_file() and time.time() - path.stat().st_mtime < ttl
+
+    def get(self, key, ttl):
+        """return the entry of a key or None if it is missing or outdated"""
+
+        if not self.contains(key, ttl):
+            return None
+
+        path = self.path(key)
+        try:
+            with gzip.open(path, "rt") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            # the file has been evicted or corrupted by another run
+            return None
+
+        # keep the modification time as it's the creation of the entry
+        os.utime(path, (time.time(), path.stat().st_mtime))
+
+        return entry
+
+    def set(self, key, entry):
+        """write the entry of a key"""
+
+        # write in a tmp file first so that concurrent reads never see partial files
+        path = self.path(key)
+        tmp = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        with gzip.open(tmp, "wt") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+        return self
+
+    def evict(self):
+        """remove the least recently used entries until the cache fits in max_size"""
+
+        files = [(f, f.stat()) for f in self.folder.glob(f"*{self.suffix}")]
+        files = sorted(files, key=lambda f: f[1].st_atime)
+
+        size = sum(stat.st_size for _, stat in files)
+        for f, stat in files:
+            if size <= self.max_size:
+                break
+            f.unlink(missing_ok=True)
+            size -= stat.st_size
+
+        return self
+
+
+class TileCache:
+    """
+    on-disk cache of the pixels of the cells vectorized locally. Each cell is stored
+    as a compressed GeoTIFF with the alert and date bands, the period of the extraction
+    is kept in the tags of the file. A tile can be reused for any period it covers
+    """
+
+    def __init__(self, folder=cp.tile_dir, max_size=cp.tile_cache_max_size):
+        # the paths, validity and eviction of the files are handled as for the cells
+        self.files = CellCache(folder, max_size, suffix=".tif")
+
+    def covers(self, key, start, end, ttl):
+        """check if a valid tile covering the period exist for this key"""
+
+        if not self.files.contains(key, ttl):
+            return False
+
+        try:
+            with rio.open(self.files.path(key)) as src:
+                tags = src.tags()
+        except rio.RasterioIOError:
+            return False
+
+        return tags["start"] <= start and end <= tags["end"]
+
+    def get(self, key, start, end, ttl):
+        """
+        return the tile of a key or None if it is missing, outdated or if it doesn't
+        cover the period. The tile is a dict with the alert and date bands, their
+        transform and the period of the extraction
+        """
+
+        if not self.covers(key, start, end, ttl):
+            return None
+
+        path = self.files.path(key)
+        try:
+            with rio.open(path) as src:
+                alert, date = src.read()
+                tile = {"alert": alert, "date": date, "transform": src.transform}
+                tile.update(src.tags())
+        except rio.RasterioIOError:
+            return None
+
+        os.utime(path, (time.time(), path.stat().st_mtime))
+
+        return tile
+
+    def set(self, key, start, end, alert, date, transform):
+        """write the pixels of a key"""
+
+        path = self.files.path(key)
+        tmp = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        profile = {
+            "driver": "GTiff",
+            "width": alert.shape[1],
+            "height": alert.shape[0],
+            "count": 2,
+            "dtype": "float32",
+            "crs": "EPSG:4326",
+            "transform": transform,
+            "tiled": True,
+            "compress": "deflate",
+            "predictor": 3,
+        }
+        with rio.open(tmp, "w", **profile) as dst:
+            dst.write(np.stack([alert, date]).astype("float32"))
+            dst.update_tags(start=start, end=end)
+        os.replace(tmp, path)
+
+        return self
+
+    def set_empty(self, key, start, end):
+        """write a tile without any alert"""
+
+        empty = np.zeros((1, 1))
+
+        return self.set(key, start, end, empty, empty, Affine.identity())
+
+    def evict(self):
+        """remove the least recently used tiles until the cache fits in max_size"""
+
+        self.files.evict()
+
+        return self
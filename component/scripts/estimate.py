@@ -0,0 +1,123 @@
+import json
+from pathlib import Path
+import threading
+
+import numpy as np
+
+from component import parameter as cp
+
+from .alert import get_alert_image, get_scale
+from .cache import cell_key, cache_ttl
+from .grid import set_grid, screen_grid
+
+# the latencies of parallel runs are written in the same file
+_lock = threading.Lock()
+
+
+def _latency_key(collection, backend):
+    """build the key of a collection/backend pair in the latency file"""
+
+    return f"{collection}_{backend}"
+
+
+def read_latencies(collection, backend):
+    """
+    read the durations of the last cells requested to GEE
+
+    Args:
+        collection (str): the collection name
+        backend (str): the vectorization backend
+
+    Returns:
+        (list): the durations in seconds, empty if the pair was never extracted
+    """
+
+    file = Path(cp.latency_file)
+    latencies = json.loads(file.read_text()) if file.is_file() else {}
+
+    return latencies.get(_latency_key(collection, backend), [])
+
+
+def record_latencies(collection, backend, durations):
+    """
+    add the durations of the cells of a run to the latency file.
+    Only the cp.max_latencies last durations are kept for each pair
+
+    Args:
+        collection (str): the collection name
+        backend (str): the vectorization backend
+        durations (list): the durations in seconds of the cells requested to GEE
+    """
+
+    if len(durations) == 0:
+        return
+
+    with _lock:
+        file = Path(cp.latency_file)
+        latencies = json.loads(file.read_text()) if file.is_file() else {}
+        key = _latency_key(collection, backend)
+        latencies[key] = [*latencies.get(key, []), *durations][-cp.max_latencies :]
+        file.write_text(json.dumps(latencies))
+
+    return
+
+
+def estimate_extraction(
+    aoi_gdf, collection, start, end, asset, mmu, backend, cache=None
+):
+    """
+    estimate the cost of an extraction without running it. The alert pixels are counted
+    at a coarse scale in a single reduction and the wall time is predicted from the
+    median duration of the cells requested in previous runs.
+
+    Args:
+        aoi_gdf (gpd.GeoDataFrame): the aoi
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        asset (str): the asset Id of the Image
+        mmu: minimal mapping unit
+        backend (str): the vectorization backend
+        cache (CellCache, optional): the cache of the previously extracted cells
+
+    Returns:
+        (dict): the number of cells, cached cells and cells to request, an upper bound
+        of the alert pixels of each cell (at the native scale), and the predicted time
+        in seconds (None if no latency was ever recorded)
+    """
+
+    grid = set_grid(aoi_gdf)
+
+    # the cached cells won't be requested
+    cached = np.zeros(len(grid), dtype=bool)
+    if cache is not None:
+        ttl = cache_ttl(collection, end)
+        for i, g in enumerate(grid.geometry):
+            key = cell_key(collection, asset, g, start, end, mmu, backend)
+            cached[i] = cache.contains(key, ttl)
+
+    # count the pixels at a coarse scale and bring them back to the native scale.
+    # a coarse pixel with alerts is counted as a full block of alerts so it's an
+    # upper bound, far above the real count for sparse alerts
+    pixels = np.zeros(len(grid))
+    if np.invert(cached).any():
+        alerts = get_alert_image(collection, start, end, asset)
+        counts = screen_grid(alerts, grid[~cached], cp.estimate_scale)
+        scale = get_scale(collection)
+        pixels[~cached] = counts * (cp.estimate_scale / scale) ** 2
+
+    # the empty cells are skipped during the extraction
+    requested = int((pixels > 0).sum())
+    latencies = read_latencies(collection, backend)
+    time_ = None
+    if len(latencies) > 0:
+        waves = np.ceil(requested / cp.max_workers)
+        time_ = float(np.median(latencies) * waves)
+
+    return {
+        "cells": len(grid),
+        "cached": int(cached.sum()),
+        "requested": requested,
+        "pixels": pixels.astype(np.int64),
+        "time": time_,
+    }
@@ -0,0 +1,313 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import random
+import time
+
+import ee
+import geopandas as gpd
+
+from component import parameter as cp
+
+from .alert import get_alert_image, get_alerts_clump, get_scale
+from .cache import cell_key, tile_key, cache_ttl, to_entry, from_entry
+from .profiler import profile_stage
+from .vectorize import get_pixels, vectorize_pixels, filter_period
+
+
+class CellTooBig(Exception):
+    """raised when a cell is known to be too big to be computed in a single request"""
+
+
+def fetch_cell(
+    geom,
+    collection,
+    start,
+    end,
+    asset,
+    mmu,
+    cache=None,
+    backend=cp.vectorization_backend,
+    executor=None,
+    tiles=None,
+    latencies=None,
+    profiler=None,
+):
+    """
+    Extract the vectorized alerts of a single grid cell.
+
+    Args:
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        asset (str): the asset Id of the Image
+        mmu: minimal mapping unit
+        cache (CellCache, optional): the cache of the previously extracted cells
+        backend (str): "gee" to vectorize the cell in GEE, "local" to download its pixels
+        executor (Executor, optional): the pool running the local vectorization
+        tiles (TileCache, optional): the cache of the pixels of the locally vectorized cells
+        latencies (list, optional): collects the duration of the cells that were requested
+        profiler (Profiler, optional): records the duration of each stage of the cell
+
+    Returns:
+        (gpd.GeoDataFrame) the alerts of the cell
+    """
+
+    # read the cell from the cache if it's still valid.
+    # cells that were split in a previous run are split again without any request
+    if cache is not None:
+        key = cell_key(collection, asset, geom, start, end, mmu, backend)
+        with profile_stage(profiler, "cache read") as stage:
+            entry = cache.get(key, cache_ttl(collection, end))
+            stage["hit"] = entry is not None
+        if entry is not None and entry.get("split", False):
+            raise CellTooBig(key)
+        elif entry is not None and "geometry" in entry:
+            return from_entry(entry)
+
+    # the alert image is built once for all the cells, they only clip it
+    all_alerts = get_alert_image(collection, start, end, asset)
+    begin = time.perf_counter()
+
+    try:
+        if backend == "local":
+            pixels = _get_tile(
+                all_alerts, geom, collection, asset, start, end, tiles, profiler
+            )
+            with profile_stage(profiler, "vectorize") as stage:
+                gdf = _vectorize_local(*pixels, mmu, executor)
+                stage["features"] = len(gdf)
+        else:
+            gdf = _fetch_gee(all_alerts, geom, mmu, get_scale(collection), profiler)
+    except Exception as e:
+        # only the errors computed by GEE are remembered, not the client ones
+        server = isinstance(e, ee.EEException)
+        if cache is not None and server and is_splittable(e):
+            cache.set(key, {"split": True})
+        raise e
+
+    if latencies is not None:
+        latencies.append(time.perf_counter() - begin)
+
+    if cache is not None:
+        with profile_stage(profiler, "cache write"):
+            cache.set(key, to_entry(gdf))
+
+    return gdf
+
+
+def _fetch_gee(alerts, geom, mmu, scale=cp.default_scale, profiler=None):
+    """vectorize the alerts of a cell in GEE at the scale of the collection"""
+
+    with profile_stage(profiler, "graph"):
+        ee_geom = ee.FeatureCollection(ee.Geometry(geom.__geo_interface__))
+        alert_clump = get_alerts_clump(alerts=alerts, aoi=ee_geom, mmu=mmu, scale=scale)
+
+    # the features are directly transfered as a GeoDataFrame to avoid building
+    # the full geojson dict tree of the cell. The request is paginated by GEE
+    # the stage includes the server computation, the transfer and the parsing
+    with profile_stage(profiler, "compute features") as stage:
+        gdf = ee.data.computeFeatures(
+            {"expression": alert_clump, "fileFormat": "GEOPANDAS_GEODATAFRAME"}
+        )
+        stage["features"] = len(gdf)
+        stage["bytes"] = int(gdf.memory_usage(deep=True).sum())
+
+    # empty collections are returned without geometry column
+    if len(gdf) == 0:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    return gdf.set_crs("EPSG:4326", allow_override=True)
+
+
+def _get_tile(alerts, geom, collection, asset, start, end, tiles=None, profiler=None):
+    """read the pixels of a cell from the tile cache or download them"""
+
+    key = tile_key(collection, asset, geom)
+    tile = None
+    if tiles is not None:
+        with profile_stage(profiler, "tile read") as stage:
+            tile = tiles.get(key, start, end, cache_ttl(collection, end))
+            stage["hit"] = tile is not None
+
+    if tile is None:
+        with profile_stage(profiler, "compute pixels") as stage:
+            alert, date, transform = get_pixels(alerts, geom, get_scale(collection))
+            stage["bytes"] = alert.nbytes + date.nbytes
+        if tiles is not None:
+            with profile_stage(profiler, "tile write"):
+                tiles.set(key, start, end, alert, date, transform)
+        return alert, date, transform
+
+    # the tile can cover a wider period than the requested one
+    start = start if start > tile["start"] else None
+    end = end if end < tile["end"] else None
+    alert = filter_period(tile["alert"], tile["date"], start, end)
+
+    return alert, tile["date"], tile["transform"]
+
+
+def _vectorize_local(alert, date, transform, mmu, executor=None):
+    """vectorize the pixels of a cell locally"""
+
+    # the labeling is CPU bound, it's sent to the process pool if any
+    if executor is None:
+        return vectorize_pixels(alert, date, transform, mmu)
+
+    return executor.submit(vectorize_pixels, alert, date, transform, mmu).result()
+
+
+def classify_error(error):
+    """
+    classify an error raised by a GEE request to decide how to recover from it
+
+    Args:
+        error (Exception): the error raised by the request
+
+    Returns:
+        (str): "split" if the computation can succeed on smaller cells, "retry" if the
+        same request can succeed later (rate limits, network) and "fatal" otherwise
+    """
+
+    if isinstance(error, CellTooBig):
+        return "split"
+
+    msg = str(error).lower()
+
+    if any(pattern in msg for pattern in cp.split_errors):
+        return "split"
+    elif any(pattern in msg for pattern in cp.retry_errors):
+        return "retry"
+    elif isinstance(error, (ConnectionError, TimeoutError)):
+        return "retry"
+
+    return "fatal"
+
+
+def is_splittable(error):
+    """check if a GEE error is caused by the size of the requested cell"""
+
+    return classify_error(error) == "split"
+
+
+def retry(fetch, cell, max_retries=cp.max_retries, profiler=None, key=None):
+    """
+    call fetch on the cell and retry with an exponential backoff when the error is
+    temporary. The waiting time is randomized (full jitter) so that the workers
+    hitting the same rate limit don't retry all at once.
+
+    Args:
+        fetch (callable): the function to apply to the cell
+        cell: the cell to process
+        max_retries (int): the maximal number of retries
+        profiler (Profiler, optional): records the duration and the retries of the cell
+        key (tuple, optional): the path of the cell in the quadtree used in the profile
+
+    Returns:
+        the result of fetch
+    """
+
+    with profile_stage(profiler, "cell", cell=key, retries=0) as stage:
+        for attempt in range(max_retries + 1):
+            try:
+                return fetch(cell)
+            except Exception as e:
+                stage["last_error"] = classify_error(e)
+                if attempt == max_retries or classify_error(e) != "retry":
+                    raise e
+
+                stage["retries"] += 1
+                delay = min(cp.backoff_cap, cp.backoff_base * 2**attempt)
+                time.sleep(random.uniform(0, delay))
+
+
+def extract_cells(
+    cells,
+    fetch,
+    alert=None,
+    max_workers=cp.max_workers,
+    split=None,
+    max_depth=cp.max_split_depth,
+    profiler=None,
+    on_result=None,
+    job=None,
+):
+    """
+    Run the fetch function on every cell of a grid using a bounded pool of workers.
+    The requests to GEE are mostly waiting for the server so they are run in threads.
+    Only max_workers cells are submitted at the same time to keep the memory footprint
+    of very large grids under control.
+
+    Temporary errors (rate limits, network) are retried with an exponential backoff.
+    If a cell is too big to be computed by GEE (timeout, memory, too many features)
+    it is replaced by the cells returned by split and requested again. Cells coming
+    back empty are never subdivided. The cells that still fail are reported instead
+    of stopping the extraction.
+
+    Args:
+        cells (list): the cells to process, usually the geometries of the grid
+        fetch (callable): the function to apply to each cell
+        alert (Alert, optional): the alert to update the progress on
+        max_workers (int): the maximal number of cells processed concurrently
+        split (callable, optional): the function subdividing a cell. If None, cells are never split
+        max_depth (int): the maximal number of time a cell can be subdivided
+        profiler (Profiler, optional): records the duration and the retries of each cell
+        on_result (callable, optional): called with the key and the result of each cell
+            as soon as it's computed, from the calling thread
+        job (Job, optional): the background job running the extraction. It's checked
+            before each submission to pause or stop the extraction
+
+    Returns:
+        (list, list): the result of each computed cell in the same order as the input cells
+        and the (cell, error) of the failed ones. The results of a subdivided cell are
+        placed at the position of their parent.
+    """
+
+    # each cell is identified by its path in the quadtree to keep a
+    # deterministic order whatever the completion order of the requests
+    queue = deque(((i,), cell) for i, cell in enumerate(cells))
+    total = len(queue)
+    results, failed = {}, {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        running = {}
+        while queue or running:
+            # fill the pool with the next cells
+            while queue and len(running) < max_workers:
+                if job is not None:
+                    job.checkpoint()
+                key, cell = queue.popleft()
+                future = executor.submit(retry, fetch, cell, profiler=profiler, key=key)
+                running[future] = (key, cell)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                key, cell = running.pop(future)
+
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    depth = len(key) - 1
+                    splittable = split is not None and depth < max_depth
+                    if splittable is False or classify_error(e) != "split":
+                        failed[key] = (cell, e)
+                    else:
+                        sub_cells = split(cell)
+                        queue.extend((key + (j,), c) for j, c in enumerate(sub_cells))
+                        total += len(sub_cells)
+                        if alert is not None:
+                            alert.set_total(total)
+                else:
+                    # the cell can be displayed while the others are still running
+                    if on_result is not None:
+                        on_result(key, results[key])
+
+                # the progress is updated from the calling thread only
+                if alert is not None:
+                    alert.update_progress()
+
+    results = [results[key] for key in sorted(results)]
+    failed = [failed[key] for key in sorted(failed)]
+
+    return results, failed
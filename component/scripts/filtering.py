@@ -0,0 +1,52 @@
+import numpy as np
+
+from .vectorize import to_code
+
+
+def filter_alerts(gdf, min_size=0, start=None, end=None):
+    """
+    select the alerts of a superset matching the minimal size and the period.
+    The bounds of the period are excluded like in the drivers
+
+    Args:
+        gdf (gpd.GeoDataFrame): the alerts sorted by decreasing surface
+        min_size (float): the minimal size of an alert in ha
+        start (str, optional): the start of the period (YYYY-MM-DD)
+        end (str, optional): the end of the period (YYYY-MM-DD)
+
+    Returns:
+        (gpd.GeoDataFrame): a copy of the selected alerts with the same index
+    """
+
+    # the surfaces are sorted so the filtered alerts are the first ones
+    nb = np.searchsorted(-gdf.surface.to_numpy(), -min_size, side="right")
+    gdf = gdf.iloc[:nb]
+
+    keep = np.ones(len(gdf), dtype=bool)
+    date = gdf.date.to_numpy(dtype=float).round(3)
+    if start is not None:
+        keep &= date > to_code(start)
+    if end is not None:
+        keep &= date < to_code(end)
+
+    return gdf[keep].copy()
+
+
+def sync_alerts(superset, gdf, columns=("review", "comment", "date", "geometry")):
+    """
+    write back the modifications of the selected alerts in the superset
+
+    Args:
+        superset (gpd.GeoDataFrame): all the alerts
+        gdf (gpd.GeoDataFrame): the selected alerts, with the same index
+        columns (tuple): the columns that can be modified by the user
+
+    Returns:
+        (gpd.GeoDataFrame): the superset sorted by decreasing surface
+    """
+
+    # the surface changes with the edited geometries
+    columns = [c for c in [*columns, "surface"] if c in gdf.columns]
+    superset.loc[gdf.index, columns] = gdf[columns]
+
+    return superset.sort_values(by=["surface"], ascending=False, kind="stable")
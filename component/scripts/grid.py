@@ -1,27 +1,34 @@
 from itertools import product
+from math import floor, ceil
 
 from shapely import geometry as sg
 import geopandas as gpd
 import numpy as np
 import ee
 
+from component import parameter as cp
 
-def set_grid(aoi_gdf):
+
+def set_grid(aoi_gdf, size=cp.grid_size):
     """
     compute a grid around a given aoi (ee.FeatureCollection) that is fit for alert extraction
-    The grid cells are tailored to be adapted to always run without timeout
-    """
+    The grid cells are coarse, the ones that cannot be computed without timeout are
+    subdivided on the fly using split_cell
 
-    # set the grid cell size in degree
-    size = 0.1
+    Args:
+        aoi_gdf (gpd.GeoDataFrame): the aoi
+        size (float): the grid cell size in degree
+    """
 
     # retreive the bounding box
-    aoi_bb = sg.box(*aoi_gdf.total_bounds)
-    min_x, min_y, max_x, max_y = aoi_bb.bounds
+    # it is snapped on a global lattice so that overlapping aois share the same cells
+    min_x, min_y, max_x, max_y = aoi_gdf.total_bounds
+    min_x, min_y = floor(min_x / size), floor(min_y / size)
+    max_x, max_y = ceil(max_x / size), ceil(max_y / size)
 
     # create numpy corrdinates table
-    longitudes = np.concatenate([np.arange(min_x, max_x, size), [max_x]])
-    lattitudes = np.concatenate([np.arange(min_y, max_y, size), [max_y]])
+    longitudes = np.round(np.arange(min_x, max_x + 1) * size, 7)
+    lattitudes = np.round(np.arange(min_y, max_y + 1) * size, 7)
 
     # filter with the geometry bounds
     min_lon, min_lat, max_lon, max_lat = aoi_gdf.total_bounds
@@ -49,3 +56,77 @@ def set_grid(aoi_gdf):
     grid = grid[np.invert(grid.is_empty)]
 
     return grid
+
+
+def split_cell(geom):
+    """
+    split a grid cell into its 4 quadrants. Quadrants falling outside of the
+    cell geometry (when the cell is cut by the aoi border) are dropped
+
+    Args:
+        geom (shapely.Geometry): the cell geometry
+
+    Returns:
+        (list): the geometries of the quadrants
+    """
+
+    min_x, min_y, max_x, max_y = geom.bounds
+    mid_x, mid_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+
+    quadrants = [
+        sg.box(min_x, min_y, mid_x, mid_y),
+        sg.box(mid_x, min_y, max_x, mid_y),
+        sg.box(min_x, mid_y, mid_x, max_y),
+        sg.box(mid_x, mid_y, max_x, max_y),
+    ]
+
+    # the intersection can be reduced to lines or points on the border of the cell
+    quadrants = [geom.intersection(q) for q in quadrants]
+
+    return [q for q in quadrants if q.area > 0]
+
+
+def screen_grid(alerts, grid, scale=cp.default_scale):
+    """
+    count the alert pixels of every cell of the grid in a single server-side reduction.
+    It's way cheaper than the vectorization and allows to skip the empty cells
+
+    Args:
+        alerts (ee.Image): the alert image covering the whole grid
+        grid (gpd.GeoSeries): the cells of the grid
+        scale (int): the scale of the reduction in meters, the native one of the
+            collection to count every pixel
+
+    Returns:
+        (np.ndarray): the number of alert pixels in each cell of the grid
+    """
+
+    cells = ee.FeatureCollection(
+        [
+            ee.Feature(ee.Geometry(geom.__geo_interface__), {"cell": i})
+            for i, geom in enumerate(grid.geometry)
+        ]
+    )
+
+    # masked pixels are not counted so empty cells are set to 0
+    counts = (
+        alerts.select("alert")
+        .gt(0)
+        .selfMask()
+        .reduceRegions(
+            collection=cells,
+            reducer=ee.Reducer.count(),
+            scale=scale,
+            tileScale=cp.screen_tile_scale,
+        )
+        .reduceColumns(ee.Reducer.toList(2), ["cell", "count"])
+        .get("list")
+        .getInfo()
+    )
+
+    # the order of the reduced features is not guaranteed
+    pixels = np.zeros(len(grid), dtype=np.int64)
+    for i, count in counts:
+        pixels[int(i)] = count
+
+    return pixels
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+import json
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+from component import parameter as cp
+
+from .alert import from_recover
+
+
+def _increment_key(aoi, collection):
+    """build the key of an aoi/collection pair in the increment file"""
+
+    return f"{aoi}_{collection}"
+
+
+def read_increment(aoi, collection):
+    """
+    read the last extraction of an aoi/collection pair
+
+    Args:
+        aoi (str): the name of the aoi
+        collection (str): the collection name
+
+    Returns:
+        (gpd.GeoDataFrame, str): the reviewed alerts of the last run and the first day
+        that still needs to be requested (YYYY-MM-DD). (None, None) if the pair was never extracted
+    """
+
+    file = Path(cp.increment_file)
+    increments = json.loads(file.read_text()) if file.is_file() else {}
+    increment = increments.get(_increment_key(aoi, collection))
+
+    if increment is None or not Path(increment["path"]).is_file():
+        return None, None
+
+    # the drivers exclude both limits of the period, the next one need to start
+    # the day before the last end to include it
+    end = datetime.strptime(increment["end"], "%Y-%m-%d")
+    start = (end - timedelta(days=1)).strftime("%Y-%m-%d")
+
+    return from_recover(increment["path"]), start
+
+
+def write_increment(aoi, collection, end, path):
+    """
+    save the last extraction of an aoi/collection pair
+
+    Args:
+        aoi (str): the name of the aoi
+        collection (str): the collection name
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        path (pathlib.Path): the file where the alerts and their review are autosaved
+    """
+
+    file = Path(cp.increment_file)
+    increments = json.loads(file.read_text()) if file.is_file() else {}
+    increments[_increment_key(aoi, collection)] = {"end": end, "path": str(path)}
+    file.write_text(json.dumps(increments, indent=2))
+
+    return
+
+
+def merge_alerts(previous, gdf):
+    """
+    add the newly extracted alerts to the alerts of a previous run.
+    The review status and the comments of the previous alerts are preserved.
+
+    Args:
+        previous (gpd.GeoDataFrame): the alerts of the previous run
+        gdf (gpd.GeoDataFrame): the new alerts prepared with prepare_alerts
+
+    Returns:
+        (gpd.GeoDataFrame): the merged alerts
+    """
+
+    # the alerts are accessed by id in the rest of the application
+    previous = previous.copy()
+    previous.index = previous["id"].to_numpy()
+
+    if len(gdf) == 0:
+        return previous
+
+    # the ids are derived from the alerts, the ones that were already found in the
+    # previous run are kept with their review
+    gdf = gdf[~gdf["id"].isin(previous["id"])]
+
+    merged = pd.concat([previous, gdf])
+
+    return gpd.GeoDataFrame(merged, crs=previous.crs)
@@ -0,0 +1,92 @@
+import threading
+
+
+class JobCancelled(Exception):
+    """raised in a job when it's cancelled by the user"""
+
+
+class Job:
+    """
+    run a function in a background thread that can be paused, resumed and cancelled.
+    The function is responsible for calling checkpoint regularly, it's where the
+    job is paused or stopped
+    """
+
+    def __init__(self, target, *args, **kwargs):
+        self._cancelled = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._thread = threading.Thread(
+            target=self._run, args=args, kwargs=kwargs, daemon=True
+        )
+        self.target = target
+        self.error = None
+        self.result = None
+
+    def _run(self, *args, **kwargs):
+        """run the target and keep its result or its error"""
+
+        try:
+            self.result = self.target(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+
+    def start(self):
+        """start the job"""
+
+        self._thread.start()
+
+        return self
+
+    def pause(self):
+        """pause the job at its next checkpoint"""
+
+        self._resumed.clear()
+
+        return self
+
+    def resume(self):
+        """resume a paused job"""
+
+        self._resumed.set()
+
+        return self
+
+    def cancel(self):
+        """stop the job at its next checkpoint"""
+
+        self._cancelled.set()
+        self._resumed.set()
+
+        return self
+
+    def checkpoint(self):
+        """block while the job is paused and raise JobCancelled if it's cancelled"""
+
+        self._resumed.wait()
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+        return
+
+    def is_alive(self):
+        """check if the job is still running"""
+
+        return self._thread.is_alive()
+
+    @property
+    def status(self):
+        """the status of the job: pending, running, paused, cancelled, failed or done"""
+
+        if self._thread.ident is None:
+            return "pending"
+        elif self._cancelled.is_set():
+            return "cancelled"
+        elif isinstance(self.error, Exception):
+            return "failed"
+        elif not self.is_alive():
+            return "done"
+        elif not self._resumed.is_set():
+            return "paused"
+
+        return "running"
@@ -0,0 +1,254 @@
+"""
+Monitoring service running the same aois on a schedule.
+
+    python -m component.cli.monitor monitors.json
+
+The configuration is a list of monitors:
+
+    [{"name": "park", "aoi": "park.gpkg", "collection": "RADD", "days": 30, "mmu": 1, "every": 24}]
+
+By default a monitor runs at the update cadence of its collection.
+
+At each run the alerts of the last "days" are compared to the alerts of the previous
+run, kept in a baseline file. Only the new and grown alerts are written in a delta file,
+with a summary of the run. The delta files are the ones to review: the review and the
+comment written in them are read back in the baseline at the next run and carried to
+the alerts that are found again.
+"""
+
+from datetime import datetime, timedelta
+import json
+import logging
+from pathlib import Path
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from component import parameter as cp
+from component.message import cm
+
+from .alert import prepare_alerts, save_alerts, from_recover
+from .batch import extract_alerts, extract_raster_alerts
+
+logger = logging.getLogger(__name__)
+
+
+def diff_alerts(previous, gdf, tolerance=cp.grown_tolerance):
+    """
+    compare the alerts of a run to the previous one. The alerts with the same id are
+    unchanged, the others are matched with the previous alerts using a spatial index.
+    An alert is "new" if it doesn't intersect any previous alert, "grown" if it's
+    bigger than the previous alert it overlaps the most and "unchanged" otherwise.
+    The matched alerts keep the review and the comment of the previous ones.
+
+    Args:
+        previous (gpd.GeoDataFrame): the alerts of the previous run
+        gdf (gpd.GeoDataFrame): the new alerts prepared with prepare_alerts
+        tolerance (float): the relative surface increase of a grown alert
+
+    Returns:
+        (gpd.GeoDataFrame, int): the new alerts with a status column and the number
+        of previous alerts that disappeared
+    """
+
+    gdf = gdf.copy()
+    gdf["status"] = "new"
+    previous = previous if previous is not None else gdf.iloc[:0]
+
+    if len(gdf) == 0 or len(previous) == 0:
+        return gdf, len(previous)
+
+    # the alerts found again are joined on their ids
+    previous = previous.set_index(previous["id"].to_numpy())
+    same = gdf["id"].isin(previous.index)
+    gdf.loc[same, "status"] = "unchanged"
+    gdf.loc[same, ["review", "comment"]] = previous.loc[
+        gdf.loc[same, "id"], ["review", "comment"]
+    ].to_numpy()
+
+    # the other ones are matched with the remaining alerts by overlap
+    changed = gdf[~same]
+    others = previous[~previous.index.isin(gdf["id"])]
+    cur, prev = others.sindex.query(changed.geometry, predicate="intersects")
+    geoms, prev_geoms = changed.geometry.to_numpy(), others.geometry.to_numpy()
+    overlap = shapely.area(shapely.intersection(geoms[cur], prev_geoms[prev]))
+    order = np.argsort(-overlap, kind="stable")
+
+    best = {}
+    for i, j in zip(cur[order], prev[order]):
+        best.setdefault(i, j)
+    for i, j in best.items():
+        id_, match = changed.index[i], others.iloc[j]
+        grown = gdf.at[id_, "surface"] > match.surface * (1 + tolerance)
+        gdf.at[id_, "status"] = "grown" if grown else "unchanged"
+        gdf.at[id_, "review"] = match.review
+        gdf.at[id_, "comment"] = match.comment
+
+    disappeared = len(others) - len(np.unique(prev))
+
+    return gdf, disappeared
+
+
+def read_reviews(previous, deltas, since):
+    """
+    copy the reviews made on delta files to the alerts of the previous run
+
+    Args:
+        previous (gpd.GeoDataFrame): the alerts of the previous run
+        deltas (list): the paths to the delta files
+        since (float): the time of the previous run, older files are not reviewed
+
+    Returns:
+        (gpd.GeoDataFrame): the previous alerts with their last reviews
+    """
+
+    previous = previous.set_index(previous["id"].to_numpy())
+
+    # the latest reviews are applied last
+    deltas = [d for d in deltas if d.stat().st_mtime > since]
+    for path in sorted(deltas, key=lambda d: d.stat().st_mtime):
+        delta = from_recover(path)
+        delta = delta[delta["id"].isin(previous.index)]
+        columns = ["review", "comment"]
+        previous.loc[delta["id"], columns] = delta[columns].to_numpy()
+
+    return previous
+
+
+def run_monitor(monitor, folder=cp.monitor_dir):
+    """
+    extract the recent alerts of a monitor, compare them with the previous run and
+    write the delta and the summary of the run
+
+    Args:
+        monitor (dict): the name, aoi, collection, days, mmu, asset, raster and backend
+        folder (pathlib.Path): the folder of the monitoring files
+
+    Returns:
+        (dict): the summary of the run
+    """
+
+    name, collection = monitor["name"], monitor["collection"]
+    mmu = monitor.get("mmu", 0)
+    today = datetime.today()
+    end = today.strftime("%Y-%m-%d")
+    start = (today - timedelta(days=monitor.get("days", 30))).strftime("%Y-%m-%d")
+
+    aoi = gpd.read_file(monitor["aoi"]).to_crs("EPSG:4326")
+    if monitor.get("raster") is not None:
+        gdf, failed = extract_raster_alerts(aoi, monitor["raster"], collection, mmu)
+    else:
+        gdf, failed = extract_alerts(
+            aoi,
+            collection,
+            start,
+            end,
+            mmu,
+            monitor.get("asset"),
+            monitor.get("backend", cp.vectorization_backend),
+        )
+
+    # the previous run is the reference of the diff, with the reviews made since
+    baseline = Path(folder) / f"{name}_{collection}.gpkg"
+    previous, kept = None, None
+    if baseline.is_file():
+        deltas = Path(folder).glob(f"{name}_{collection}_*_delta.gpkg")
+        previous = from_recover(baseline)
+        previous = read_reviews(previous, deltas, baseline.stat().st_mtime)
+
+    # the alerts of the failed cells are unknown, the previous ones are kept as they
+    # are instead of being reported as disappeared
+    if previous is not None and len(failed) > 0:
+        cells = gpd.GeoSeries([cell for cell, _ in failed], crs="EPSG:4326")
+        inside = cells.sindex.query(previous.geometry, predicate="intersects")[0]
+        inside = np.isin(np.arange(len(previous)), inside)
+        previous, kept = previous[~inside], previous[inside]
+
+    if len(gdf) > 0:
+        gdf = gdf[gdf.surface >= mmu]
+    if len(gdf) > 0:
+        gdf = prepare_alerts(gdf)
+    gdf, disappeared = diff_alerts(previous, gdf)
+
+    # only the alerts that need to be reviewed are written in the delta
+    delta = gdf[gdf.status.isin(["new", "grown"])] if len(gdf) else gdf
+    prefix = Path(folder) / f"{name}_{collection}_{end}"
+    if len(delta) > 0:
+        save_alerts(delta, prefix.with_name(f"{prefix.name}_delta.gpkg"))
+    current = gdf.drop(columns="status")
+    if kept is not None:
+        kept = kept[~kept["id"].isin(current.get("id", []))]
+        current = gpd.GeoDataFrame(pd.concat([current, kept]), crs="EPSG:4326")
+
+    # a run without alerts is the new reference as well, the alerts of the failed
+    # cells are kept in current so nothing unknown is lost
+    if len(current) > 0:
+        save_alerts(current, baseline)
+    else:
+        baseline.unlink(missing_ok=True)
+
+    summary = {
+        "name": name,
+        "collection": collection,
+        "start": start,
+        "end": end,
+        "run": today.isoformat(timespec="seconds"),
+        "alerts": len(gdf),
+        "disappeared": disappeared,
+        "failed_cells": len(failed),
+        **{s: int((gdf.status == s).sum()) for s in ["new", "grown", "unchanged"]},
+    }
+    prefix.with_name(f"{prefix.name}_summary.json").write_text(json.dumps(summary))
+
+    return summary
+
+
+def _every(monitor):
+    """the time between 2 runs of a monitor in seconds"""
+
+    cadence = cp.alert_drivers.get(monitor["collection"], {}).get("cadence", 1)
+
+    return monitor.get("every", cadence * 24) * 3600
+
+
+def serve(monitors, folder=cp.monitor_dir, once=False):
+    """
+    run the monitors forever, each one every "every" hours. The last run of each
+    monitor is kept in the folder so a restarted service doesn't run them again
+
+    Args:
+        monitors (list): the monitors
+        folder (pathlib.Path): the folder of the monitoring files
+        once (bool): run the due monitors once and return
+    """
+
+    state_file = Path(folder) / "state.json"
+
+    while True:
+        state = json.loads(state_file.read_text()) if state_file.is_file() else {}
+
+        # run the due monitors, a failing monitor doesn't stop the others
+        for monitor in monitors:
+            key = f"{monitor['name']}_{monitor['collection']}"
+            if time.time() - state.get(key, 0) < _every(monitor):
+                continue
+
+            try:
+                logger.info(run_monitor(monitor, folder))
+            except Exception as e:
+                logger.exception(cm.monitor.failed.format(key, e))
+
+            state[key] = time.time()
+            state_file.write_text(json.dumps(state))
+
+        if once is True:
+            return
+
+        # wait for the next due monitor
+        next_runs = [
+            state.get(f"{m['name']}_{m['collection']}", 0) + _every(m) for m in monitors
+        ]
+        time.sleep(max(60, min(next_runs) - time.time()))
@@ -0,0 +1,109 @@
+from contextlib import contextmanager, nullcontext
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+
+class Profiler:
+    """
+    thread-safe recorder of the durations of the extraction stages. The stages are
+    saved as complete events of the Chrome trace format that can be opened in
+    chrome://tracing or https://ui.perfetto.dev. Each stage can carry values such as
+    the payload bytes, the number of features or the number of retries
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def _now(self):
+        """return the time since the creation of the profiler in microseconds"""
+
+        return (time.perf_counter() - self.origin) * 10**6
+
+    @contextmanager
+    def stage(self, name, **args):
+        """
+        record the duration of the wrapped block. The yielded dict can be filled with
+        values computed inside the block (bytes, features...)
+
+        Args:
+            name (str): the name of the stage
+            args: the values attached to the stage (the cell, the collection...)
+        """
+
+        begin = self._now()
+        try:
+            yield args
+        finally:
+            self.add(name, begin, self._now() - begin, **args)
+
+    def add(self, name, ts, dur, **args):
+        """add a stage that started at ts and lasted dur microseconds"""
+
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": ts,
+            "dur": dur,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {k: _to_json(v) for k, v in args.items()},
+        }
+        with self._lock:
+            self.events.append(event)
+
+        return self
+
+    def summary(self):
+        """return the number of calls and the total duration (s) of each stage"""
+
+        summary = {}
+        with self._lock:
+            events = list(self.events)
+
+        for e in events:
+            stage = summary.setdefault(e["name"], {"calls": 0, "duration": 0})
+            stage["calls"] += 1
+            stage["duration"] += e["dur"] / 10**6
+            for k in ["bytes", "features", "retries"]:
+                if k in e["args"]:
+                    stage[k] = stage.get(k, 0) + e["args"][k]
+
+        return summary
+
+    def save(self, path):
+        """write the trace and its summary as a json file"""
+
+        with self._lock:
+            events = list(self.events)
+
+        trace = {"traceEvents": events, "otherData": {"summary": self.summary()}}
+        Path(path).write_text(json.dumps(trace))
+
+        return path
+
+
+def profile_stage(profiler, name, **args):
+    """return a stage of the profiler or an empty context if profiler is None"""
+
+    if profiler is None:
+        return nullcontext(args)
+
+    return profiler.stage(name, **args)
+
+
+def _to_json(value):
+    """cast the values of a stage to json compatible types"""
+
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    elif isinstance(value, tuple):
+        return list(value)
+    elif hasattr(value, "item"):
+        return value.item()
+
+    return str(value)
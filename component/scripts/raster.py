@@ -0,0 +1,135 @@
+import geopandas as gpd
+import numpy as np
+import rasterio as rio
+from rasterio import features, windows
+
+from component.message import cm
+
+from .vectorize import vectorize_pixels
+
+
+def read_cell(path, collection, geom):
+    """
+    read the pixels of a local NRT or CUSUM raster covering a grid cell and remap
+    them to the alert and date bands of the application (see _from_nrt and _from_cusum).
+    Only the blocks of the file intersecting the cell are read.
+
+    Args:
+        path (str): the path to the GeoTIFF file
+        collection (str): "NRT" or "CUSUM"
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+
+    Returns:
+        (np.ndarray, np.ndarray, Affine, CRS): the alert band, the date band, the
+        transform and the crs of the arrays. None if the cell is outside of the file
+    """
+
+    with rio.open(path) as src:
+        # find the window of the cell in the file crs
+        geom = gpd.GeoSeries([geom], crs="EPSG:4326").to_crs(src.crs)[0]
+        window = windows.from_bounds(*geom.bounds, transform=src.transform)
+        window = window.round_offsets().round_lengths()
+        try:
+            window = window.intersection(windows.Window(0, 0, src.width, src.height))
+        except windows.WindowError:
+            return None
+
+        transform = src.window_transform(window)
+        data = src.read(window=window, masked=True)
+        crs = src.crs
+        bands = {d: i for i, d in enumerate(src.descriptions) if d is not None}
+
+    # pixels are assigned to the cell containing their center
+    inside = features.geometry_mask(
+        [geom], out_shape=data.shape[1:], transform=transform, invert=True
+    )
+    mask = np.ma.getmaskarray(data).any(axis=0) | np.invert(inside)
+
+    if collection == "NRT":
+        alert, date = _remap_nrt(data, bands)
+    elif collection == "CUSUM":
+        alert, date = _remap_cusum(data)
+    else:
+        raise Exception(cm.alert.wrong_collection.format(collection))
+
+    alert[mask] = 0
+
+    return alert, date, transform, crs
+
+
+def _remap_nrt(data, bands):
+    """numpy version of _from_nrt"""
+
+    # use the band names if the file embeds them
+    count = data[bands.get("detection_count", 0)].filled(0)
+    date = data[bands.get("first_detection_date", 1)].filled(0).astype(float)
+
+    # only confirmed alerts are taken into account
+    # we split confirmed from potential by looking at the number of observations
+    alert = np.where(count >= 3, 1, np.where(count >= 1, 2, 0)).astype(np.uint16)
+
+    # create a unique date band
+    year = np.floor(date)
+    day = (date - year) * 365
+    date = year + day / 1000
+
+    return alert, date
+
+
+def _remap_cusum(data):
+    """numpy version of _from_cusum"""
+
+    # the alert is considered high confidence if the confidece is above offset
+    offset = 0.7
+    confidence = data[2].filled(0)
+    alert = np.where(confidence >= offset, 1, 2).astype(np.uint16)
+
+    # create a unique date band
+    date = data[0].filled(0).astype(float)
+
+    return alert, date
+
+
+def vectorize_cell(path, collection, geom, mmu):
+    """
+    read and vectorize the alerts of a local raster in a grid cell
+
+    Args:
+        path (str): the path to the GeoTIFF file
+        collection (str): "NRT" or "CUSUM"
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+        mmu: minimal mapping unit in ha
+
+    Returns:
+        (gpd.GeoDataFrame): the alerts polygons of the cell
+    """
+
+    pixels = read_cell(path, collection, geom)
+    if pixels is None:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    alert, date, transform, crs = pixels
+
+    return vectorize_pixels(alert, date, transform, mmu, crs)
+
+
+def fetch_raster_cell(geom, path, collection, mmu, executor=None):
+    """
+    Extract the vectorized alerts of a single grid cell from a local raster.
+    It has the same role as fetch_cell without any request to GEE.
+
+    Args:
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+        path (str): the path to the GeoTIFF file
+        collection (str): "NRT" or "CUSUM"
+        mmu: minimal mapping unit in ha
+        executor (Executor, optional): the pool running the reading and vectorization
+
+    Returns:
+        (gpd.GeoDataFrame) the alerts of the cell
+    """
+
+    if executor is None:
+        return vectorize_cell(path, collection, geom, mmu)
+
+    return executor.submit(vectorize_cell, path, collection, geom, mmu).result()
@@ -1,9 +1,10 @@
-from sepal_ui.scripts import utils as su
+from datetime import date
+from functools import lru_cache
+import calendar
 
 import ee
 
 
-@su.need_ee
 def to_date(dates):
     """
     transform a date store as (int) number of days since 2018-12-31 to a date in YYYY.ddd
@@ -59,3 +60,75 @@ def to_date(dates):
     dates = dates.subtract(dates_adjustment)
 
     return years.add(dates.divide(1000))
+
+
+@lru_cache()
+def date_table(last_year=2070):
+    """
+    precompute the conversion table of to_date as piecewise-linear breakpoints.
+    The conversion is evaluated in python for every day up to the last_year with the
+    exact same algorithm as to_date. Each run of consecutive days is a linear segment
+    so only its first and last days are kept in the table.
+
+    Args:
+        last_year (int): the last year of the table (same as to_date)
+
+    Returns:
+        (list, list): the number of days since 2018-12-31 and the matching YYYY.ddd
+    """
+
+    reference_year = 2018
+    leap_years = [y for y in range(reference_year, last_year + 1) if calendar.isleap(y)]
+
+    def convert(days):
+        """transcription of to_date for a single integer value"""
+
+        years = (days + 364) // 365 + reference_year
+        nb_leap_years = sum(y <= years for y in leap_years)
+        days += nb_leap_years
+        years = (days + 364) // 365 + reference_year
+        is_leap_year = int(years in leap_years)
+        jan_first = (
+            (years - reference_year) * 365 - 364 + nb_leap_years + 1 - is_leap_year
+        )
+        days = days - jan_first + 1
+        days -= int(is_leap_year == 1 and days <= 31 + 29)
+
+        return years, days
+
+    # keep the first and last day of each segment of consecutive days
+    last = (date(last_year, 12, 31) - date(reference_year, 12, 31)).days
+    x, y, prev = [], [], None
+    for days in range(last + 1):
+        year, day = convert(days)
+        if prev is not None and (year, day) == (prev[0], prev[1] + 1):
+            prev = (year, day)
+            continue
+
+        if prev is not None and x[-1] != days - 1:
+            x.append(days - 1)
+            y.append(prev[0] + prev[1] / 1000)
+
+        x.append(days)
+        y.append(year + day / 1000)
+        prev = (year, day)
+
+    if x[-1] != last:
+        x.append(last)
+        y.append(prev[0] + prev[1] / 1000)
+
+    return x, y
+
+
+def to_date_lut(dates):
+    """
+    transform a date store as (int) number of days since 2018-12-31 to a date in YYYY.ddd
+    It gives the same values as to_date using a precomputed table and a single
+    interpolation instead of the per-pixel array operations.
+    """
+
+    x, y = date_table()
+
+    # dates are integers so they always fall on the breakpoints or inside a segment
+    # the output stays in double as float32 can't hold YYYY.ddd at the day precision
+    return dates.interpolate(x, y, "extrapolate").double()
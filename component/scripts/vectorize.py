@@ -0,0 +1,191 @@
+from datetime import datetime
+from math import ceil
+
+import ee
+import geopandas as gpd
+import numpy as np
+from pyproj import CRS
+from rasterio import features
+from rasterio.transform import Affine
+from shapely import geometry as sg
+
+from component import parameter as cp
+
+
+def get_pixels(alerts, geom, scale):
+    """
+    download the alert and date bands of a cell as numpy arrays
+
+    Args:
+        alerts (ee.Image): the alert image
+        geom (shapely.Geometry): the geometry of the cell in EPSG:4326
+        scale (int): the resolution of the download in meters
+
+    Returns:
+        (np.ndarray, np.ndarray, Affine): the alert band, the date band and the
+        transform of the arrays in EPSG:4326
+    """
+
+    # build a grid aligned on the top left corner of the cell
+    min_x, min_y, max_x, max_y = geom.bounds
+    res = scale / cp.degree_length
+    width = max(1, ceil((max_x - min_x) / res))
+    height = max(1, ceil((max_y - min_y) / res))
+    transform = Affine(res, 0, min_x, 0, -res, max_y)
+
+    # the pixels outside of the cell are masked and downloaded as 0 (no alert)
+    image = (
+        alerts.select(["alert", "date"])
+        .toFloat()
+        .clip(ee.Geometry(geom.__geo_interface__))
+    )
+    pixels = ee.data.computePixels(
+        {
+            "expression": image,
+            "fileFormat": "NUMPY_NDARRAY",
+            "grid": {
+                "dimensions": {"width": width, "height": height},
+                "affineTransform": {
+                    "scaleX": res,
+                    "shearX": 0,
+                    "translateX": min_x,
+                    "shearY": 0,
+                    "scaleY": -res,
+                    "translateY": max_y,
+                },
+                "crsCode": "EPSG:4326",
+            },
+        }
+    )
+
+    return pixels["alert"], pixels["date"], transform
+
+
+def to_code(day):
+    """convert a YYYY-MM-DD date to the YYYY.ddd format of the date band"""
+
+    day = datetime.strptime(day, "%Y-%m-%d")
+
+    return day.year + day.timetuple().tm_yday / 1000
+
+
+def filter_period(alert, date, start=None, end=None):
+    """
+    remove the alerts outside of a period. The bounds are excluded like in the drivers
+
+    Args:
+        alert (np.ndarray): the alert band, 0 for no alert
+        date (np.ndarray): the date band in YYYY.ddd
+        start (str, optional): the start of the period (YYYY-MM-DD)
+        end (str, optional): the end of the period (YYYY-MM-DD)
+
+    Returns:
+        (np.ndarray): the filtered alert band
+    """
+
+    # the dates are rounded as they are downloaded in float32
+    date = np.round(date.astype(float), 3)
+
+    keep = np.ones(alert.shape, dtype=bool)
+    if start is not None:
+        keep &= date > to_code(start)
+    if end is not None:
+        keep &= date < to_code(end)
+
+    return np.where(keep, alert, 0)
+
+
+def pixel_area(transform, height, crs="EPSG:4326"):
+    """
+    compute the area of the pixels of each row of a grid
+
+    Args:
+        transform (Affine): the transform of the grid
+        height (int): the number of rows
+        crs (str): the crs of the grid
+
+    Returns:
+        (np.ndarray): the area of a pixel in each row in ha (column vector)
+    """
+
+    # projected grids are expected to be in meters
+    if not CRS.from_user_input(crs).is_geographic:
+        area = np.full(height, abs(transform.a * transform.e))
+        return (area / 10**4)[:, None]
+
+    # the area of a spherical cell only depends on the sinus of its latitudes
+    lat = np.radians(transform.f + transform.e * np.arange(height + 1))
+    res = np.radians(abs(transform.a))
+    area = cp.earth_radius**2 * res * np.abs(np.diff(np.sin(lat)))
+
+    return (area / 10**4)[:, None]
+
+
+def vectorize_pixels(alert, date, transform, mmu, crs="EPSG:4326"):
+    """
+    label the connected alert pixels, filter them with the mmu and polygonize them.
+    The output has the same columns as the GEE vectorization (see get_alerts_clump)
+
+    Args:
+        alert (np.ndarray): the alert band, 0 for no alert
+        date (np.ndarray): the date band in YYYY.ddd
+        transform (Affine): the transform of the arrays
+        mmu: minimal mapping unit in ha
+        crs (str): the crs of the arrays
+
+    Returns:
+        (gpd.GeoDataFrame): the alerts polygons of the cell in EPSG:4326
+    """
+
+    mask = alert > 0
+    if not mask.any():
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    # every 8-connected patch of alert pixels is a polygon
+    shapes = features.shapes(
+        mask.astype(np.uint8), mask=mask, connectivity=8, transform=transform
+    )
+    polygons = [sg.shape(geom) for geom, _ in shapes]
+
+    # burn the polygons back to label the pixels, the polygons follow the pixel
+    # edges so the labels match the patches exactly
+    labels = features.rasterize(
+        ((p, i) for i, p in enumerate(polygons, start=1)),
+        out_shape=mask.shape,
+        transform=transform,
+        dtype="int32",
+    )
+
+    # compute the attributes of each label in a single pass on the alert pixels
+    nb = len(polygons) + 1
+    area = np.broadcast_to(pixel_area(transform, mask.shape[0], crs), mask.shape)
+    labels, alert, date, area = labels[mask], alert[mask], date[mask], area[mask]
+
+    # the dates are downloaded in float32, they are rounded to the day to match
+    # the doubles of the GEE vectorization
+    date = np.round(date.astype(float), 3)
+
+    surface = np.bincount(labels, weights=area, minlength=nb)
+    pixels = np.bincount(labels, minlength=nb)
+    date_min = np.full(nb, np.inf)
+    np.minimum.at(date_min, labels, date)
+    date_max = np.full(nb, -np.inf)
+    np.maximum.at(date_max, labels, date)
+    alert_min = np.full(nb, np.iinfo(np.int32).max)
+    np.minimum.at(alert_min, labels, alert.astype(np.int32))
+
+    gdf = gpd.GeoDataFrame(
+        {
+            "label": np.arange(1, nb),
+            "surface": surface[1:],
+            "date": date_min[1:],
+            "date_max": date_max[1:],
+            "alert": alert_min[1:],
+            "pixels": pixels[1:],
+        },
+        geometry=polygons,
+        crs=crs,
+    )
+    gdf = gdf[gdf.surface >= mmu].reset_index(drop=True)
+
+    return gdf.to_crs("EPSG:4326")
@@ -0,0 +1,380 @@
+"""
+Persistent work queue to run large extractions with several worker processes.
+
+The cells of an extraction are written in a SQLite database. Each worker claims
+cells one by one, extracts them and writes their alerts back in the database so
+that a crashed or restarted run resumes from the unfinished cells. The database
+can be shared by several machines if it's on a file system supporting locks.
+
+    python -m component.cli.work_queue submit aoi.gpkg RADD 2023-01-01 2023-06-30
+    python -m component.cli.work_queue work <job>  # in as many processes as needed
+    python -m component.cli.work_queue merge <job> alerts.gpkg
+
+A worker restarted with the same --name takes back the cells it had claimed.
+The merged file can be opened in the application with the RECOVER collection.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from functools import partial
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import time
+import zlib
+
+import geopandas as gpd
+import pandas as pd
+from shapely import wkt
+
+from component import parameter as cp
+from component.message import cm
+
+from .alert import prepare_alerts, save_alerts
+from .cache import CellCache, to_entry, from_entry
+from .extraction import fetch_cell, retry, classify_error
+from .grid import set_grid, split_cell
+
+_schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cells (
+    job TEXT NOT NULL,
+    key TEXT NOT NULL,
+    geometry TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'todo',
+    worker TEXT,
+    claimed REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result BLOB,
+    error TEXT,
+    PRIMARY KEY (job, key)
+);
+CREATE INDEX IF NOT EXISTS cells_status ON cells (job, status);
+"""
+
+
+def job_id(name, params):
+    """
+    build the id of an extraction job. The same aoi and parameters always give the
+    same job so that submitting it again resumes it
+
+    Args:
+        name (str): the name of the aoi
+        params (dict): the parameters of fetch_cell
+
+    Returns:
+        (str): the id of the job
+    """
+
+    params = json.dumps([name, params], sort_keys=True)
+
+    return hashlib.sha256(params.encode()).hexdigest()[:16]
+
+
+def _cell_key(key):
+    """convert a quadtree path to a sortable text key"""
+
+    return "/".join([f"{key[0]:06d}", *(str(i) for i in key[1:])])
+
+
+class WorkQueue:
+    """
+    SQLite queue of the cells of extraction jobs. A cell is "todo", "claimed" by a
+    worker, "done" with its alerts, "split" in 4 new cells or "failed"
+    """
+
+    def __init__(self, path=cp.queue_file, timeout=cp.claim_timeout):
+        self.path = path
+        self.timeout = timeout
+
+        with closing(self._connect()) as con:
+            con.executescript(_schema)
+
+    def _connect(self):
+        """open a connection in autocommit mode, transactions are explicit"""
+
+        con = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+
+        return con
+
+    def submit(self, job, params, cells):
+        """
+        add a job and its cells to the queue. The cells that already exist are kept
+        with their status so submitting a job again resumes it
+
+        Args:
+            job (str): the id of the job
+            params (dict): the parameters of fetch_cell
+            cells (list): the geometries of the grid cells
+
+        Returns:
+            (str): the id of the job
+        """
+
+        rows = [(job, _cell_key((i,)), g.wkt) for i, g in enumerate(cells)]
+        with closing(self._connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?)",
+                (job, json.dumps(params), time.time()),
+            )
+            con.executemany(
+                "INSERT OR IGNORE INTO cells (job, key, geometry) VALUES (?, ?, ?)",
+                rows,
+            )
+            con.execute("COMMIT")
+
+        return job
+
+    def params(self, job):
+        """return the parameters of a job"""
+
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT params FROM jobs WHERE job=?", (job,)).fetchone()
+
+        if row is None:
+            raise Exception(cm.queue.no_job.format(job))
+
+        return json.loads(row[0])
+
+    def claim(self, job, worker):
+        """
+        claim the next cell of a job. The cells claimed by a worker for more than
+        the timeout are considered abandoned and can be claimed again
+
+        Args:
+            job (str): the id of the job
+            worker (str): the name of the worker
+
+        Returns:
+            (str, shapely.Geometry): the key and the geometry of the cell, None if
+            there is nothing left to claim
+        """
+
+        with closing(self._connect()) as con:
+            # the write lock is taken before the select so a cell is claimed only once
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute(
+                "SELECT key, geometry FROM cells WHERE job=? AND "
+                "(status='todo' OR (status='claimed' AND claimed<?)) "
+                "ORDER BY key LIMIT 1",
+                (job, time.time() - self.timeout),
+            ).fetchone()
+            if row is not None:
+                con.execute(
+                    "UPDATE cells SET status='claimed', worker=?, claimed=?, "
+                    "attempts=attempts+1 WHERE job=? AND key=?",
+                    (worker, time.time(), job, row[0]),
+                )
+            con.execute("COMMIT")
+
+        return None if row is None else (row[0], wkt.loads(row[1]))
+
+    def complete(self, job, key, gdf):
+        """write the alerts of a cell and mark it as done"""
+
+        result = zlib.compress(json.dumps(to_entry(gdf)).encode())
+        self._update(job, key, status="done", result=result, error=None)
+
+        return self
+
+    def split(self, job, key, cells):
+        """replace a cell by its sub-cells"""
+
+        rows = [(job, f"{key}/{i}", g.wkt) for i, g in enumerate(cells)]
+        with closing(self._connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                "UPDATE cells SET status='split' WHERE job=? AND key=?", (job, key)
+            )
+            con.executemany(
+                "INSERT OR IGNORE INTO cells (job, key, geometry) VALUES (?, ?, ?)",
+                rows,
+            )
+            con.execute("COMMIT")
+
+        return self
+
+    def release(self, job, worker):
+        """
+        put the cells claimed by a worker back in the queue. It's called when the
+        worker starts so that a restarted worker resumes its own cells
+
+        Args:
+            job (str): the id of the job
+            worker (str): the name of the worker
+        """
+
+        with closing(self._connect()) as con:
+            con.execute(
+                "UPDATE cells SET status='todo' WHERE job=? AND status='claimed' "
+                "AND worker=?",
+                (job, worker),
+            )
+
+        return self
+
+    def fail(self, job, key, error):
+        """mark a cell as failed"""
+
+        self._update(job, key, status="failed", error=str(error))
+
+        return self
+
+    def retry_failed(self, job):
+        """put the failed cells of a job back in the queue"""
+
+        with closing(self._connect()) as con:
+            con.execute(
+                "UPDATE cells SET status='todo' WHERE job=? AND status='failed'", (job,)
+            )
+
+        return self
+
+    def _update(self, job, key, **values):
+        """update the columns of a cell"""
+
+        columns = ", ".join(f"{c}=?" for c in values)
+        with closing(self._connect()) as con:
+            con.execute(
+                f"UPDATE cells SET {columns} WHERE job=? AND key=?",
+                (*values.values(), job, key),
+            )
+
+        return
+
+    def progress(self, job):
+        """return the number of cells of a job in each status"""
+
+        with closing(self._connect()) as con:
+            rows = con.execute(
+                "SELECT status, COUNT(*) FROM cells WHERE job=? GROUP BY status", (job,)
+            ).fetchall()
+
+        return dict(rows)
+
+    def results(self, job):
+        """
+        merge the alerts of the done cells of a job in the order of the grid
+
+        Args:
+            job (str): the id of the job
+
+        Returns:
+            (gpd.GeoDataFrame): the alerts of the job
+        """
+
+        with closing(self._connect()) as con:
+            rows = con.execute(
+                "SELECT result FROM cells WHERE job=? AND status='done' ORDER BY key",
+                (job,),
+            ).fetchall()
+
+        gdfs = [from_entry(json.loads(zlib.decompress(r[0]))) for r in rows]
+        gdfs = [gdf for gdf in gdfs if len(gdf) > 0]
+
+        if len(gdfs) == 0:
+            return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+        return gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True), crs="EPSG:4326")
+
+
+def run_worker(job, path=cp.queue_file, max_workers=cp.max_workers, name=None):
+    """
+    extract the cells of a job until there is nothing left to claim. The cells are
+    requested concurrently by max_workers threads, each of them claiming its own cells.
+    Several workers can run on the same job.
+
+    Args:
+        job (str): the id of the job
+        path (pathlib.Path): the path to the queue database
+        max_workers (int): the number of cells extracted concurrently
+        name (str, optional): the name of the worker, default to host-pid. A worker
+            restarted with the same name takes back the cells it had claimed
+
+    Returns:
+        (dict): the number of cells of the job in each status
+    """
+
+    queue = WorkQueue(path)
+    cache = CellCache()
+    fetch = partial(fetch_cell, **queue.params(job), cache=cache)
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    queue.release(job, name)
+
+    def work():
+        while True:
+            claimed = queue.claim(job, name)
+            if claimed is None:
+                return
+
+            key, geom = claimed
+            try:
+                gdf = retry(fetch, geom)
+            except Exception as e:
+                depth = key.count("/")
+                if classify_error(e) == "split" and depth < cp.max_split_depth:
+                    queue.split(job, key, split_cell(geom))
+                else:
+                    queue.fail(job, key, e)
+            else:
+                queue.complete(job, key, gdf)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(work) for _ in range(max_workers)]:
+            future.result()
+    cache.evict()
+
+    return queue.progress(job)
+
+
+def submit_aoi(
+    path, collection, start, end, mmu, asset=None, backend="gee", queue=cp.queue_file
+):
+    """
+    write the grid of an aoi file in the queue
+
+    Args:
+        path (str): the path to the aoi file (any format readable by geopandas)
+        collection (str): the collection name
+        start (str): the start of the analysis (YYYY-MM-DD)
+        end (str): the end day of the analysis (YYYY-MM-DD)
+        mmu: minimal mapping unit
+        asset (str, optional): the asset Id of the Image
+        backend (str): the vectorization backend
+        queue (pathlib.Path): the path to the queue database
+
+    Returns:
+        (str): the id of the job
+    """
+
+    params = {
+        "collection": collection,
+        "start": start,
+        "end": end,
+        "asset": asset,
+        "mmu": mmu,
+        "backend": backend,
+    }
+    aoi = gpd.read_file(path).to_crs("EPSG:4326")
+    grid = set_grid(aoi)
+    job = job_id(str(path), params)
+
+    return WorkQueue(queue).submit(job, params, grid.geometry)
+
+
+def merge_job(job, output, queue=cp.queue_file):
+    """write the alerts of a job as a gpkg file readable by the RECOVER mode"""
+
+    gdf = WorkQueue(queue).results(job)
+    if len(gdf) == 0:
+        raise Exception(cm.view.alert.error.no_alerts)
+
+    return save_alerts(prepare_alerts(gdf), output)
@@ -3,7 +3,9 @@ import time
 
 import ee
 import geopandas as gpd
+import pandas as pd
 from traitlets import Int
+from ipyleaflet import GeoJSON
 
 from sepal_ui import sepalwidgets as sw
 from sepal_ui.scripts import utils as su
@@ -58,6 +60,11 @@ class AlertView(sw.Card):
             label=cm.view.alert.asset.label, types=["IMAGE"]
         ).hide()
 
+        # the NRT and CUSUM outputs can also be read from a local file
+        self.w_raster = sw.FileInput(
+            label=cm.view.alert.raster.label, extentions=[".tif", ".tiff"]
+        ).hide()
+
         # add a file selector for the vietnamese alert system
         self.w_file = sw.FileInput(extentions=[".geojson", ".gpkg", ".shp"]).hide()
         self.w_date = sw.DatePicker().hide()
@@ -72,18 +79,53 @@ class AlertView(sw.Card):
             v_model=None, items=cp.time_delta, label=cm.view.alert.recent.label
         ).hide()
 
+        # only retreive the days since the last run of the same aoi and collection
+        self.w_incremental = sw.Checkbox(
+            label=cm.view.alert.incremental.label, v_model=False
+        ).hide()
+
+        # select where the alerts of the GEE collections are vectorized
+        self.w_backend = sw.Select(
+            v_model=self.alert_model.backend,
+            items=cp.vectorization_backends,
+            label=cm.view.alert.backend.label,
+        ).hide()
+
         # create a datepickers row to select the 2 historical dates
         self.w_historic = cw.DateLine().hide()
 
+        # the cells that failed during the last extraction
+        self.failed = []
+
+        # the durations of the stages of the last extraction
+        self.profiler = None
+
+        # the extracted cells waiting to be displayed and the layers of the displayed
+        # ones until the extraction ends
+        self.pending = []
+        self.last_render = 0
+        self.loading_layers = []
+
+        # the background job loading the alerts
+        self.job = None
+
         # select the minimal size of the alerts
         self.w_size = cw.SurfaceSelect()
 
         # set a btn to validate and load the alerts
         self.btn = sw.Btn(cm.view.alert.btn.label)
 
+        # set a btn to estimate the cost of the extraction without running it
+        self.btn_estimate = sw.Btn(
+            cm.view.alert.estimate.label, outlined=True, class_="ml-1"
+        )
+
         # set an alert to display information to the end user
         self.alert = Alert()
 
+        # manually decorate the functions
+        self.estimate = su.loading_button(self.alert, self.btn_estimate)(self.estimate)
+
         # bind the widgets and the model
         # w_recent binding will be done manually
         (
@@ -93,20 +135,26 @@ class AlertView(sw.Card):
             .bind(self.w_historic.w_end, "end")
             .bind(self.w_size, "min_size")
             .bind(self.w_asset, "asset")
+            .bind(self.w_raster, "raster")
+            .bind(self.w_incremental, "incremental")
+            .bind(self.w_backend, "backend")
         )
 
         super().__init__(
             children=[
                 self.w_alert,
                 self.w_asset,
+                self.w_raster,
                 self.w_alert_type,
                 self.w_recent,
+                self.w_incremental,
                 self.w_historic,
                 self.w_file,
                 self.w_date,
                 self.w_file_recover,
                 self.w_size,
-                self.btn,
+                self.w_backend,
+                sw.Row(children=[self.btn, self.btn_estimate], class_="ma-0"),
                 self.alert,
             ],
             class_="mt-5",
@@ -118,8 +166,11 @@ class AlertView(sw.Card):
         self.w_alert.observe(self._set_alert_collection, "v_model")
         self.w_recent.observe(self._set_recent_period, "v_model")
         self.btn.on_event("click", self.load_alerts)
+        self.btn_estimate.on_event("click", self.estimate)
         self.aoi_model.observe(self.remove_alerts, "name")
         self.w_asset.observe(self.set_period, "v_model")
+        self.alert_model.observe(self._filter_alerts, ["min_size", "start", "end"])
+        self.w_raster.observe(self.set_period, "v_model")
         self.w_alert.observe(self.display_spatial_extent, "v_model")
         self.w_asset.observe(self.display_spatial_extent, "v_model")
 
@@ -133,8 +184,47 @@ class AlertView(sw.Card):
 
         return
 
-    @su.loading_button()
     def load_alerts(self, widget, event, data):
+        """
+        load the alerts in a background job so that the map and the metadata
+        remain usable during the extraction
+        """
+
+        # only one extraction can run at a time
+        if self.job is not None and self.job.is_alive():
+            return
+
+        self.job = cs.Job(self._run_job)
+        self.alert.set_job(self.job)
+        self.job.start()
+
+        return self
+
+    def _run_job(self):
+        """run the extraction and report its errors as the loading_button would"""
+
+        self.btn.loading, self.btn.disabled = True, True
+
+        try:
+            self._load_alerts()
+        except cs.JobCancelled:
+            self.alert.add_msg(cm.widget.job.cancelled, "warning")
+        except Exception as e:
+            self.alert.add_msg(str(e), "error")
+        finally:
+            # the alerts loaded before a failure are kept in the model and displayed
+            # in a single layer
+            if len(self.loading_layers) > 0:
+                self.clear_loading()
+                if self.alert_model.gdf is not None:
+                    self.add_alert_layer()
+            self.pending = []
+            self.alert.clear_job()
+            self.btn.loading, self.btn.disabled = False, False
+
+        return
+
+    def _load_alerts(self):
         """load the alerts in the model"""
 
         # check that all variables are set
@@ -148,42 +238,101 @@ class AlertView(sw.Card):
         su.check_input(self.alert_model.min_size, cm.view.alert.error.no_size)
 
         # clean the current display if necessary
+        self.failed = []
+        self.profiler = cs.Profiler()
         self.alert_model.current_id = None
         self.map.remove_layer(cm.map.layer.alerts, none_ok=True)
 
-        if self.w_alert.v_model in ["GLAD-L", "RADD", "NRT", "GLAD-S", "CUSUM"]:
-            gdf = self.load_from_gee()
+        # in incremental mode only the days since the last run are requested
+        # and the new alerts are added to the reviewed ones
+        start, previous = self.alert_model.start, None
+        incremental = self.alert_model.incremental is True and self.w_recent.viz
+        if incremental is True:
+            previous, last_start = cs.read_increment(
+                self.aoi_model.name, self.alert_model.alert_collection
+            )
+            start = max(start, last_start or start)
+
+        # the alerts are displayed as soon as they are extracted, on top of the
+        # reviewed ones in incremental mode. They are filtered at the end only
+        # the autosave file is set once so that it doesn't follow the filters
+        self.pending, self.last_render = [], 0
+        self.alert_model.all_gdf, self.alert_model.extent = None, None
+        self.alert_model.path = self.alert_model.get_path(self.aoi_model.name)
+        self.alert_model.gdf = previous
+        if previous is not None:
+            self.add_alert_layer()
+
+        driver = cp.alert_drivers.get(self.w_alert.v_model, {})
+        local = driver.get("raster", False) and self.alert_model.raster
+        if local:
+            self.load_from_raster()
+        elif self.w_alert.v_model in cs.gee_collections():
+            self.load_from_gee(start)
         elif self.w_alert.v_model in ["SINGLE-DATE", "RECOVER", "JJ-FAST"]:
-            gdf = self.load_from_geojson()
-
-        # exit if gdf is empty
-        if len(gdf) == 0:
-            raise Exception(cm.view.alert.error.no_alerts)
+            with self.profiler.stage("load file"):
+                self.pending.append(self.load_from_geojson(start))
 
-        # set all the unset values
+        # the alerts are kept unfiltered in the model to change the filters
+        # without extraction. The recovered alerts are never filtered and the files
+        # are not filtered at extraction
+        extent, min_size = None, self.alert_model.min_size
         if self.w_alert.v_model not in ["RECOVER"]:
-            gdf["review"] = cm.view.metadata.status.unset
-            gdf["comment"] = ""  # add a comment column with empty string
-            gdf = gdf[gdf.surface >= self.alert_model.min_size]  # filter alerts
-            gdf = gdf.sort_values(by=["surface"], ignore_index=True, ascending=False)
-            gdf["id"] = gdf.index  # reset the ids
-            gdf["original_geometry"] = gdf["geometry"].apply(
-                lambda g: g.__geo_interface__
+            file_ = self.w_alert.v_model in ["SINGLE-DATE", "JJ-FAST"]
+            extent = {
+                "collection": self.alert_model.alert_collection,
+                "min_size": 0 if file_ else min_size,
+                "start": self.alert_model.start,
+                "end": self.alert_model.end,
+            }
+
+        # the last alerts are added to the model and all of them are filtered under
+        # the lock of the model so that the reviews made in the metadata during the
+        # extraction are kept
+        with self.alert_model.lock:
+            gdf = self.merge_loaded()
+
+            # write the profile of the run next to the results
+            path = self.alert_model.get_path(self.aoi_model.name, "json")
+            self.profiler.save(path.with_name(f"{path.stem}_profile.json"))
+
+            # exit if no alert is selected, nothing can be recovered if every
+            # cell failed
+            empty = len(gdf) == 0
+            if not empty and extent is not None:
+                empty = not (gdf.surface >= min_size).any()
+            if empty and len(self.failed) > 0:
+                raise self.failed[0][1]
+            elif empty:
+                raise Exception(cm.view.alert.error.no_alerts)
+
+            # save it in the model
+            self.alert_model.set_alerts(gdf, extent, self.alert_model.path)
+
+        # keep track of the run for the next incremental update. The merged alerts
+        # are saved right away in the autosave file that will keep their reviews.
+        # A run with failed cells is not recorded so that they are requested again
+        if incremental is True and len(self.failed) == 0:
+            cs.write_increment(
+                aoi=self.aoi_model.name,
+                collection=self.alert_model.alert_collection,
+                end=self.alert_model.end,
+                path=self.alert_model.save(),
             )
 
-        # save it in the model
-        self.alert_model.gdf = gdf
-
         # add the layer on the map
-        layer = self.alert_model.get_ipygeojson()
-        layer.on_click(self.on_alert_click)
-        self.map.add_layer(layer)
+        self.add_alert_layer()
 
         # reset in case an error was displayed
-        self.alert.reset()
+        # and report the cells that could not be extracted
+        self.alert.clear_job().reset()
+        if len(self.failed) > 0:
+            msg = cm.view.alert.error.failed.format(len(self.failed), self.failed[0][1])
+            self.alert.add_msg(msg, "warning")
 
-        # zoom back to the aoi
-        self.map.zoom_ee_object(self.aoi_model.feature_collection.geometry())
+        # zoom back to the aoi if no alert is being reviewed
+        if self.alert_model.current_id is None:
+            self.map.zoom_ee_object(self.aoi_model.feature_collection.geometry())
 
         # remove the alert bounds layer
         self.map.remove_layer("alert extend", none_ok=True)
@@ -192,6 +341,155 @@ class AlertView(sw.Card):
 
         return self
 
+    def estimate(self, widget, event, data):
+        """estimate the cost of the extraction of the GEE collections"""
+
+        # check that all variables are set
+        su.check_input(self.aoi_model.feature_collection, cm.view.alert.error.no_aoi)
+        su.check_input(
+            self.alert_model.alert_collection, cm.view.alert.error.no_collection
+        )
+        su.check_input(self.alert_model.start, cm.view.alert.error.no_start)
+        su.check_input(self.alert_model.end, cm.view.alert.error.no_end)
+        gee = cs.gee_collections()
+        if self.w_alert.v_model not in gee or self.alert_model.raster:
+            raise Exception(cm.view.alert.estimate.no_gee)
+
+        estimate = cs.estimate_extraction(
+            aoi_gdf=self.aoi_model.gdf,
+            collection=self.alert_model.alert_collection,
+            start=self.alert_model.start,
+            end=self.alert_model.end,
+            asset=self.alert_model.asset,
+            mmu=self.alert_model.min_size,
+            backend=self.alert_model.backend,
+            cache=cs.CellCache(),
+        )
+
+        pixels = estimate["pixels"]
+        msg = cm.view.alert.estimate.result.format(
+            estimate["cells"],
+            estimate["cached"],
+            estimate["requested"],
+            pixels.mean() if len(pixels) else 0,
+            pixels.max() if len(pixels) else 0,
+        )
+        self.alert.add_msg(msg)
+
+        if estimate["time"] is None:
+            self.alert.append_msg(cm.view.alert.estimate.no_time)
+        else:
+            self.alert.append_msg(cm.view.alert.estimate.time.format(estimate["time"]))
+
+        return
+
+    def _on_cell(self, key, gdf):
+        """keep the alerts of an extracted cell and display them regularly"""
+
+        if len(gdf) > 0:
+            self.pending.append(gdf)
+
+        if time.time() - self.last_render >= cp.render_interval:
+            self.render_pending()
+
+        return
+
+    def render_pending(self):
+        """
+        add the alerts of the cells extracted since the last render to the model and
+        display them in their own layer so that they can be reviewed during the
+        extraction. Only the new alerts are drawn, the layers are replaced by a
+        single one at the end of the extraction (see merge_loaded)
+        """
+
+        self.last_render = time.time()
+        pending = [gdf for gdf in self.pending if len(gdf) > 0]
+        self.pending = []
+
+        if len(pending) == 0:
+            return
+
+        with cs.profile_stage(self.profiler, "render") as stage:
+            gdf = pd.concat(pending, ignore_index=True)
+            gdf = gpd.GeoDataFrame(gdf, crs="EPSG:4326")
+            stage["features"] = len(gdf)
+
+            # set all the unset values of the new alerts, the recovered ones keep
+            # their ids
+            if self.w_alert.v_model not in ["RECOVER"]:
+                gdf = cs.prepare_alerts(gdf)
+            else:
+                gdf.index = gdf["id"].to_numpy()
+
+            # the alerts already found in another cell are dropped on their ids
+            with self.alert_model.lock:
+                current = self.alert_model.gdf
+                gdf = gdf[~gdf.index.duplicated()]
+                if current is None:
+                    self.alert_model.gdf = gdf
+                else:
+                    gdf = gdf[~gdf.index.isin(current.index)]
+                    self.alert_model.gdf = cs.merge_alerts(current, gdf)
+
+            layer = GeoJSON(
+                data=gdf.__geo_interface__,
+                style=cp.alert_style,
+                hover_style={**cp.alert_style, "weight": 5},
+                name=cm.map.layer.alerts,
+            )
+            layer.on_click(self.on_alert_click)
+            self.loading_layers.append(layer)
+            self.map.add_layer(layer)
+
+        return
+
+    def merge_loaded(self):
+        """
+        add the last extracted alerts to the model and remove the layers of the
+        extraction, they are replaced by a single layer (see add_alert_layer)
+
+        Returns:
+            (gpd.GeoDataFrame): all the alerts
+        """
+
+        self.render_pending()
+        self.clear_loading()
+
+        if self.alert_model.gdf is None:
+            return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+        return self.alert_model.gdf
+
+    def clear_loading(self):
+        """remove the layers of the extraction and the alerts waiting to be displayed"""
+
+        for layer in self.loading_layers:
+            self.map.remove_layer(layer, none_ok=True)
+        self.loading_layers, self.pending = [], []
+
+        return
+
+    def add_alert_layer(self):
+        """display the current alerts on the map"""
+
+        self.map.remove_layer(cm.map.layer.alerts, none_ok=True)
+        layer = self.alert_model.get_ipygeojson()
+        layer.on_click(self.on_alert_click)
+        self.map.add_layer(layer)
+
+        return
+
+    def _filter_alerts(self, change):
+        """select again the alerts of the last extraction when the filters change"""
+
+        # a new extraction is needed if the filters are wider than the last one
+        if self.alert_model.filter_alerts() is False:
+            return
+
+        self.add_alert_layer()
+
+        return
+
     def on_alert_click(self, feature, **kwargs):
         """
         change the current id on click on a specific alert feature
@@ -229,22 +527,32 @@ class AlertView(sw.Card):
         self.w_alert_type.hide()
         self.w_historic.hide()  # reset elswhere
         self.w_recent.hide()  # reset elsewhere
+        self.w_incremental.hide()
+        self.w_backend.hide()
         self.w_asset.hide().reset()
+        self.w_raster.hide().reset()
         self.w_file.hide().reset()
         self.w_date.hide().reset()
         self.w_file_recover.hide().reset()
 
-        # if nrt system is set I need to show the asset select widget first
-        # the datepicker is discarded as the information won't be needed
-        if change["new"] in ["NRT", "CUSUM"]:
+        # the widgets depend on the capabilities of the selected system
+        driver = cp.alert_drivers.get(change["new"], {})
+
+        # if the system is computed by the user I need to show the asset select
+        # widget first, the datepicker is discarded as the information won't be needed
+        if driver.get("footprint") == "asset":
             self.w_asset.show()
+            self.w_raster.viz = driver.get("raster", False)
+            self.w_backend.show()
 
         # init the datepicker with appropriate min and max values
-        elif change["new"] in ["RADD", "GLAD-L", "GLAD-S", "JJ-FAST"]:
+        elif "available_years" in driver:
             self.w_alert_type.show()
             self.w_alert_type.v_model = "RECENT"
             self.w_recent.show()
-            year_list = cp.alert_drivers[change["new"]]["available_years"]
+            self.w_incremental.show()
+            self.w_backend.viz = change["new"] in cs.gee_collections()
+            year_list = driver["available_years"]
             self.w_historic.init(min(year_list), max(year_list))
 
             # glad L dataset is in maintenance for now
@@ -261,7 +569,8 @@ class AlertView(sw.Card):
         elif change["new"] in ["RECOVER"]:
             self.w_file_recover.show()
 
-        if change["new"] in ["NRT", "SINGLE-DATE", "RECOVER"]:
+        # the systems without datepicker get their dates from the asset if any
+        if change["new"] is not None and "available_years" not in driver:
             self.alert_model.start = "2022-01-01"  # dummy dates
             self.alert_model.end = "2022-01-01"  # dummy dates
 
@@ -283,6 +592,7 @@ class AlertView(sw.Card):
         # I can't guarantee that previous visibility is hide because of NRT options
         self.w_historic.viz = self.w_alert_type.v_model == "HISTORICAL"
         self.w_recent.viz = self.w_alert_type.v_model == "RECENT"
+        self.w_incremental.viz = self.w_alert_type.v_model == "RECENT"
 
         return
 
@@ -304,14 +614,13 @@ class AlertView(sw.Card):
         """display the spatial extend f the selected alert system on the map"""
 
         # check the extent
-        if self.w_alert.v_model in ["GLAD-L", "RADD"]:
-            obj = ee.ImageCollection(cp.alert_drivers[self.w_alert.v_model]["asset"])
-        elif self.w_alert.v_model in ["GLAD-S"]:
-            obj = ee.Image(cp.alert_drivers[self.w_alert.v_model]["asset"])
-        elif (
-            self.w_alert.v_model in ["CUSUM", "NRT"]
-            and self.w_asset.v_model is not None
-        ):
+        driver = cp.alert_drivers.get(self.w_alert.v_model, {})
+        footprint = driver.get("footprint")
+        if footprint == "collection":
+            obj = ee.ImageCollection(driver["asset"])
+        elif footprint == "image":
+            obj = ee.Image(driver["asset"])
+        elif footprint == "asset" and self.w_asset.v_model is not None:
             obj = ee.Image(self.w_asset.v_model)
         else:
             self.map.remove_layer("alert extend", none_ok=True)
@@ -325,53 +634,52 @@ class AlertView(sw.Card):
 
         return
 
-    def load_from_gee(self):
-        """load the data into a gdf using the gee API and a grid"""
+    def load_from_gee(self, start):
+        """load the alerts of a GEE collection in the displayed layers using a grid"""
 
-        # create the grid
-        grid = cs.set_grid(self.aoi_model.gdf)
-
-        # loop in the grid to avoid timeout in the define AOI
         # display information to the user
         self.alert.reset().show()
-        self.alert.set_total(len(grid))
-        data = None
-        for i, geom in enumerate(grid.geometry):
-            ee_geom = ee.FeatureCollection(ee.Geometry(geom.__geo_interface__))
 
-            # load the alerts in the system
-            all_alerts = cs.get_alerts(
-                collection=self.alert_model.alert_collection,
-                start=self.alert_model.start,
-                end=self.alert_model.end,
-                aoi=ee_geom,
-                asset=self.alert_model.asset,
-            )
+        # the cells are displayed as soon as they are extracted
+        _, self.failed = cs.extract_alerts(
+            aoi_gdf=self.aoi_model.gdf,
+            collection=self.alert_model.alert_collection,
+            start=start,
+            end=self.alert_model.end,
+            mmu=self.alert_model.min_size,
+            asset=self.alert_model.asset,
+            backend=self.alert_model.backend,
+            alert=self.alert,
+            profiler=self.profiler,
+            on_result=self._on_cell,
+            job=self.job,
+        )
 
-            alert_clump = cs.get_alerts_clump(
-                alerts=all_alerts, aoi=ee_geom, mmu=self.alert_model.min_size
-            )
+        # display the last cells
+        return self.render_pending()
 
-            if data is None:
-                data = alert_clump.getInfo()
-            else:
-                data["features"] += alert_clump.getInfo()["features"]
+    def load_from_raster(self):
+        """load the alerts of a local NRT or CUSUM raster in the displayed layers"""
 
-            self.alert.update_progress()
-
-        # save the clumps as a geoJson dict in the model
-        # exit if nothing is found
-        if len(data["features"]) == 0:
-            raise Exception(cm.view.alert.error.no_alerts)
-        else:
-            gdf = gpd.GeoDataFrame.from_features(data, crs="EPSG:4326")
+        # display information to the user
+        self.alert.reset().show()
 
-        # compute the surfaces for each geometry in square meters
-        gdf["surface"] = gdf.to_crs("EPSG:3857").area / 10000
+        # no request is sent to GEE
+        _, self.failed = cs.extract_raster_alerts(
+            aoi_gdf=self.aoi_model.gdf,
+            path=self.alert_model.raster,
+            collection=self.alert_model.alert_collection,
+            mmu=self.alert_model.min_size,
+            alert=self.alert,
+            profiler=self.profiler,
+            on_result=self._on_cell,
+            job=self.job,
+        )
 
-        return gdf
+        # display the last cells
+        return self.render_pending()
 
-    def load_from_geojson(self):
+    def load_from_geojson(self, start):
         """load a file from a file of another work alert system"""
 
         if self.w_alert.v_model == "SINGLE-DATE":
@@ -380,10 +688,11 @@ class AlertView(sw.Card):
             gdf = cs.from_recover(self.w_file_recover.v_model)
         elif self.w_alert.v_model == "JJ-FAST":
             gdf = cs.from_jj_fast(
-                start=self.alert_model.start,
+                start=start,
                 end=self.alert_model.end,
                 aoi=self.aoi_model.gdf,
                 alert=self.alert,
+                job=self.job,
             )
 
         return gdf
@@ -159,8 +159,9 @@ class MetadataView(sw.Card):
                 shape = sg.shape(self.map.alert_dc.data[0]["geometry"])
 
             surface = gpd.GeoSeries([shape], crs=4326).to_crs(3857).area.squeeze()
-            self.alert_model.gdf.at[self.w_id.v_model, "geometry"] = shape
-            self.alert_model.gdf.at[self.w_id.v_model, "surface"] = surface / 10000
+            with self.alert_model.lock:
+                self.alert_model.gdf.at[self.w_id.v_model, "geometry"] = shape
+                self.alert_model.gdf.at[self.w_id.v_model, "surface"] = surface / 10000
 
             self.w_id.unable()
 
@@ -195,7 +196,8 @@ class MetadataView(sw.Card):
             return
 
         # set the value in the dataframe
-        self.alert_model.gdf.at[self.w_id.v_model, "review"] = change["new"]
+        with self.alert_model.lock:
+            self.alert_model.gdf.at[self.w_id.v_model, "review"] = change["new"]
 
         # autosave
         self._autosave()
@@ -205,7 +207,8 @@ class MetadataView(sw.Card):
     def _on_comment_change(self, change):
         """change the comment of the feature in the dataframe"""
 
-        self.alert_model.gdf.at[self.w_id.v_model, "comment"] = change["new"]
+        with self.alert_model.lock:
+            self.alert_model.gdf.at[self.w_id.v_model, "comment"] = change["new"]
 
         # autosave
         self._autosave()
@@ -226,7 +229,8 @@ class MetadataView(sw.Card):
         date = datetime(int(year), int(month), int(day))
         date = int(date.strftime("%j")) / 1000 + date.year
 
-        self.alert_model.gdf.at[self.w_id.v_model, "date"] = date
+        with self.alert_model.lock:
+            self.alert_model.gdf.at[self.w_id.v_model, "date"] = date
 
         # autosave
         self._autosave()
@@ -234,18 +238,9 @@ class MetadataView(sw.Card):
         return
 
     def _autosave(self):
-        """save the current gdf as a geojson. Triggered by any modification to the metadata"""
+        """save the alerts in the file of their extraction. Triggered by any modification to the metadata"""
 
-        # gather the strings
-        aoi = self.aoi_model.name
-        start = self.alert_model.start
-        end = self.alert_model.end
-        min_size = self.alert_model.min_size
-
-        # build the name of the file and save it
-        name = f"{aoi}_{start}_{end}_{min_size}"
-        path = cp.result_dir / f"{name}.gpkg"
-        self.alert_model.gdf.to_file(path, layer=cm.map.layer.alerts, driver="GPKG")
+        self.alert_model.save()
 
         return
 
@@ -325,14 +320,16 @@ class MetadataView(sw.Card):
 
     def _on_alerts_change(self, change):
 
-        self.w_id.v_model = None
-
         if self.alert_model.gdf is None:
+            self.w_id.v_model = None
             return
 
         # update the dynamic select
+        # the alert being reviewed is kept if it's still in the new alerts
         id_list = self.alert_model.gdf.id.tolist()
         self.w_id.set_items(id_list)
+        if self.w_id.v_model not in id_list:
+            self.w_id.v_model = None
 
         # unable the export btns
         self.btn_csv.disabled = False
@@ -354,12 +351,9 @@ class MetadataView(sw.Card):
         # copy the original gdf to avoid mutable modifications
         gdf = self.alert_model.gdf.copy()
 
-        # create the name
-        name = f"{self.aoi_model.name}_{self.alert_model.start}_{self.alert_model.end}_{self.alert_model.min_size}"
-
-        # identify the format
+        # identify the format and create the name
         format_ = widget.attributes["data"]
-        path = cp.result_dir / f"{name}.{format_}"
+        path = self.alert_model.get_path(self.aoi_model.name, format_)
 
         if format_ == "csv":
 
@@ -5,6 +5,8 @@ import sepal_ui.sepalwidgets as sw
 from sepal_ui import color as sepal_color
 import sepal_ui.sepalwidgets as sw
 
+from component.message import cm
+
 
 class Alert(sw.Alert):
     """Custom alert component with a new method to replace the progress bar by just counting the number of steps."""
@@ -15,10 +17,93 @@ class Alert(sw.Alert):
         # Create a count span
         self.count_span = CountSpan("Progress", with_total=True)
 
+        # Create the controls of the running job
+        self.job = None
+        self.btn_pause = sw.Btn(
+            cm.widget.job.pause,
+            "fa-solid fa-pause",
+            small=True,
+            outlined=True,
+            class_="mr-1",
+        )
+        self.btn_cancel = sw.Btn(
+            cm.widget.job.cancel,
+            "fa-solid fa-times",
+            color="error",
+            small=True,
+            outlined=True,
+        )
+        self.job_controls = sw.Row(
+            children=[self.btn_pause, self.btn_cancel], class_="ma-0 mt-2"
+        )
+
+        self.btn_pause.on_event("click", self._on_pause)
+        self.btn_cancel.on_event("click", self._on_cancel)
+
     def set_total(self, total):
         """Set the total value of the span"""
         self.count_span.set_total(total)
 
+    def set_job(self, job):
+        """display the controls of a background job"""
+
+        self.job = job
+        self.btn_pause.msg = cm.widget.job.pause
+        self.btn_pause.gliph = "fa-solid fa-pause"
+        self.btn_pause.disabled = False
+        self.btn_cancel.disabled = False
+        self._add_controls()
+
+        return self
+
+    def clear_job(self):
+        """remove the controls of the finished job"""
+
+        self.job = None
+        self.children = [c for c in self.children if c is not self.job_controls]
+
+        return self
+
+    def _add_controls(self):
+        """add the job controls if a job is running"""
+
+        if self.job is not None and self.job_controls not in self.children:
+            self.children = self.children + [self.job_controls]
+            self.show()
+
+        return
+
+    def _on_pause(self, widget, event, data):
+        """pause or resume the job"""
+
+        if self.job is None:
+            return
+
+        paused = self.job.status == "paused"
+        if paused:
+            self.job.resume()
+        else:
+            self.job.pause()
+            self.add_msg(cm.widget.job.paused, "warning")
+            self._add_controls()
+
+        self.btn_pause.msg = cm.widget.job.pause if paused else cm.widget.job.resume
+        self.btn_pause.gliph = "fa-solid fa-pause" if paused else "fa-solid fa-play"
+
+        return
+
+    def _on_cancel(self, widget, event, data):
+        """cancel the job"""
+
+        if self.job is None:
+            return
+
+        self.job.cancel()
+        self.btn_pause.disabled = True
+        self.btn_cancel.disabled = True
+
+        return
+
     def update_progress(self) -> None:
         """update the count span message"""
 
@@ -26,6 +111,7 @@ class Alert(sw.Alert):
 
         if self.count_span not in self.children:
             self.children = self.children + [self.count_span]
+        self._add_controls()
 
         self.show()
         self.count_span.update()
@@ -40,6 +126,9 @@ class Alert(sw.Alert):
 
         super().reset()
 
+        # the controls of a running job are kept
+        self._add_controls()
+
         return self
 
 